@@ -4,15 +4,53 @@ Boss battles, weapons, double jump, and more!
 """
 
 import pygame
+import os
 import sys
+import time
+import json
+import argparse
+import multiprocessing
+import pickle
+import copy
+import threading
+import queue
+import cProfile
+import pstats
+import tracemalloc
+import weakref
+import zlib
+import socket
+import subprocess
+import struct
 import random
 import math
 import array
+import bisect
+from collections import deque
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 SCREEN_WIDTH = 800
 SCREEN_HEIGHT = 600
 TILE_SIZE = 32
 FPS = 60
+DRAW_MARGIN = 5 * TILE_SIZE
+RENDER_CHUNK_COLS = 16
+ENDLESS_CHUNK_COLS = 32
+ENDLESS_LOOKAHEAD = SCREEN_WIDTH * 2
+ENDLESS_KEEP_BEHIND = SCREEN_WIDTH
+REWIND_TICKS = 10 * FPS
+REWIND_KEYFRAME_INTERVAL = FPS
+PROFILE_FRAMES = 300
+TRACE_EVENTS = 200000
+MEMORY_REPORT_INTERVAL = 30 * FPS
+MEMORY_GROWTH_FLAG_KB = 256
+SOUND_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "supar-mayro")
+SOUND_BANK_VERSION = 2
+TILE_LAYER_KEY = (255, 0, 255)
 
 WHITE = (255, 255, 255)
 BLACK = (0, 0, 0)
@@ -58,6 +96,126 @@ ENEMY_SPEED = 2
 MAX_FALL_SPEED = 12
 DOUBLE_JUMP_FORCE = -11
 
+AI_THINKS_PER_TICK = 8
+AI_BUDGET_MS = None
+
+# Cosmetic settings per quality tier, best first; QualityGovernor picks the tier.
+QUALITY_TIERS = [
+    {"particles": 400, "trail": 5, "effects": True, "shake": True, "hud_interval": 1},
+    {"particles": 120, "trail": 3, "effects": True, "shake": True, "hud_interval": 2},
+    {"particles": 40, "trail": 1, "effects": False, "shake": False, "hud_interval": 6},
+    {"particles": 0, "trail": 0, "effects": False, "shake": False, "hud_interval": 15},
+]
+QUALITY = QUALITY_TIERS[0]
+TRACER = None
+MEMORY = None
+
+SUBPIXEL_BITS = 8
+SUBPIXEL = 1 << SUBPIXEL_BITS
+FIXED_POINT = False
+
+
+def set_fixed_point(enabled):
+    """Switch moving entities between float and fixed-point physics.
+    
+    Must be called before entities are created, since velocities are stored
+    in the units of the active mode.
+    """
+    global FIXED_POINT
+    FIXED_POINT = enabled
+
+
+def set_quality_tier(tier):
+    """Apply one of QUALITY_TIERS; only drawing and other cosmetic work read it."""
+    global QUALITY
+    QUALITY = QUALITY_TIERS[tier]
+
+
+def trace_begin(name):
+    """Open a span on the calling thread when --trace is on; close it with trace_end()."""
+    if TRACER is not None:
+        TRACER.begin(name)
+
+
+def trace_end():
+    if TRACER is not None:
+        TRACER.end()
+
+
+def units(value):
+    """A speed or acceleration in pixels per tick, in the active physics units.
+    
+    Fixed-point mode works in integer 1/SUBPIXEL pixel steps.
+    """
+    return round(value * SUBPIXEL) if FIXED_POINT else value
+
+
+def step(body, axis, velocity):
+    """Distance body travels along axis (0 = x, 1 = y) this tick, in pixels.
+    
+    In fixed-point mode this includes the sub-pixel carry left in body.carry,
+    and is an exact binary fraction, so it can be passed to sweeps as is.
+    """
+    if not FIXED_POINT:
+        return velocity
+    return (body.carry[axis] + velocity) / SUBPIXEL
+
+
+def move_rect(body, axis, distance):
+    """Move body.rect by a distance from step.
+    
+    Float mode leaves rounding to pygame.Rect.  Fixed-point mode moves by
+    whole pixels and keeps the remainder in body.carry, so slow movement
+    accumulates instead of being rounded away.
+    """
+    if FIXED_POINT:
+        total = int(distance * SUBPIXEL)
+        body.carry[axis] = total & (SUBPIXEL - 1)
+        distance = total >> SUBPIXEL_BITS
+    if axis:
+        body.rect.y += distance
+    else:
+        body.rect.x += distance
+
+
+def stop(body, axis):
+    """Drop the sub-pixel carry after body was snapped to a tile edge."""
+    body.carry[axis] = 0
+
+
+def move(body, vel_x, vel_y):
+    move_rect(body, 0, step(body, 0, vel_x))
+    move_rect(body, 1, step(body, 1, vel_y))
+
+
+def toward(dx, dy, magnitude):
+    """Length of (dx, dy) and the velocity of the given magnitude along it."""
+    if FIXED_POINT:
+        dist = max(1, math.isqrt(dx * dx + dy * dy))
+        magnitude = units(magnitude)
+        return dist, dx * magnitude // dist, dy * magnitude // dist
+    dist = max(1, math.sqrt(dx*dx + dy*dy))
+    return dist, dx / dist * magnitude, dy / dist * magnitude
+
+
+def damp(velocity, factor):
+    if FIXED_POINT:
+        return velocity * units(factor) >> SUBPIXEL_BITS
+    return velocity * factor
+
+
+SINE_STEPS = 1024
+SINE_TABLE = [round(math.sin(2 * math.pi * i / SINE_STEPS) * SUBPIXEL) for i in range(SINE_STEPS)]
+TWO_PI_UNITS = round(2 * math.pi * SUBPIXEL)
+
+
+def wave(amplitude, t, rate):
+    """int(amplitude * sin(t * rate)); fixed-point mode uses SINE_TABLE instead of libm."""
+    if FIXED_POINT:
+        angle = t * units(rate)
+        return amplitude * SINE_TABLE[angle * SINE_STEPS // TWO_PI_UNITS % SINE_STEPS] >> SUBPIXEL_BITS
+    return int(amplitude * math.sin(t * rate))
+
 TILE_EMPTY = 0
 TILE_GROUND = 1
 TILE_BLOCK = 2
@@ -69,6 +227,8 @@ TILE_SPIKE_UP = 7
 TILE_PLATFORM_MOVING = 8
 TILE_BOSS_DOOR = 9
 
+SOLID_TILES = (TILE_GROUND, TILE_BLOCK, TILE_PIPE, TILE_PIPE_TOP)
+
 STATE_PLAYING = 0
 STATE_GAME_OVER = 1
 STATE_WIN = 2
@@ -85,6 +245,7 @@ class Player:
         
         self.vel_x = 0
         self.vel_y = 0
+        self.carry = [0, 0]
         self.on_ground = False
         self.facing_right = True
         self.can_double_jump = False
@@ -102,29 +263,28 @@ class Player:
         self.anim_frame = 0
         self.anim_timer = 0
     
-    def update(self, keys, tiles, platforms):
+    def update(self, keys, grid, platforms):
         if not self.alive:
             return
         
         self.vel_x = 0
         if keys[pygame.K_LEFT] or keys[pygame.K_a]:
-            self.vel_x = -PLAYER_SPEED
+            self.vel_x = units(-PLAYER_SPEED)
             self.facing_right = False
         if keys[pygame.K_RIGHT] or keys[pygame.K_d]:
-            self.vel_x = PLAYER_SPEED
+            self.vel_x = units(PLAYER_SPEED)
             self.facing_right = True
         
-        self.rect.x += self.vel_x
-        self.handle_collision(tiles, horizontal=True)
+        self.handle_collision(grid, horizontal=True)
         
         if (keys[pygame.K_SPACE] or keys[pygame.K_w]) and not getattr(self, 'jump_held', False):
             if self.on_ground:
-                self.vel_y = JUMP_FORCE
+                self.vel_y = units(JUMP_FORCE)
                 self.on_ground = False
                 self.can_double_jump = True
                 self.jumps_left = 1
             elif self.can_double_jump and self.jumps_left > 0:
-                self.vel_y = DOUBLE_JUMP_FORCE
+                self.vel_y = units(DOUBLE_JUMP_FORCE)
                 self.jumps_left -= 1
                 self.can_double_jump = False
         
@@ -133,13 +293,12 @@ class Player:
         else:
             self.jump_held = True
         
-        self.vel_y += GRAVITY
-        if self.vel_y > MAX_FALL_SPEED:
-            self.vel_y = MAX_FALL_SPEED
+        self.vel_y += units(GRAVITY)
+        if self.vel_y > units(MAX_FALL_SPEED):
+            self.vel_y = units(MAX_FALL_SPEED)
         
-        self.rect.y += self.vel_y
         self.on_ground = False
-        self.handle_collision(tiles, horizontal=False)
+        self.handle_collision(grid, horizontal=False)
         
         for platform in platforms:
             if self.rect.colliderect(platform.rect):
@@ -155,8 +314,8 @@ class Player:
             self.shoot_cooldown -= 1
         
         for bullet in self.bullets[:]:
-            bullet.update()
-            if bullet.rect.right < 0 or bullet.rect.left > 4000:
+            bullet.update(grid)
+            if bullet.spent or bullet.rect.right < grid.left or bullet.rect.left > grid.right:
                 self.bullets.remove(bullet)
         
         self.anim_timer += 1
@@ -171,23 +330,31 @@ class Player:
             self.bullets.append(bullet)
             self.shoot_cooldown = 15
     
-    def handle_collision(self, tiles, horizontal):
-        for tile in tiles:
-            if tile.type in (TILE_GROUND, TILE_BLOCK, TILE_PIPE, TILE_PIPE_TOP):
-                if self.rect.colliderect(tile.rect):
-                    if horizontal:
-                        if self.vel_x > 0:
-                            self.rect.right = tile.rect.left
-                        elif self.vel_x < 0:
-                            self.rect.left = tile.rect.right
-                    else:
-                        if self.vel_y > 0:
-                            self.rect.bottom = tile.rect.top
-                            self.vel_y = 0
-                            self.on_ground = True
-                        elif self.vel_y < 0:
-                            self.rect.top = tile.rect.bottom
-                            self.vel_y = 0
+    def handle_collision(self, grid, horizontal):
+        if horizontal:
+            dx = step(self, 0, self.vel_x)
+            hit = grid.sweep(self.rect, dx, 0)
+            if hit is None:
+                move_rect(self, 0, dx)
+                return
+            if self.vel_x > 0:
+                self.rect.right = hit[1].left
+            else:
+                self.rect.left = hit[1].right
+            stop(self, 0)
+        else:
+            dy = step(self, 1, self.vel_y)
+            hit = grid.sweep(self.rect, 0, dy)
+            if hit is None:
+                move_rect(self, 1, dy)
+                return
+            if self.vel_y > 0:
+                self.rect.bottom = hit[1].top
+                self.on_ground = True
+            else:
+                self.rect.top = hit[1].bottom
+            self.vel_y = 0
+            stop(self, 1)
     
     def draw(self, surface, camera_x):
         if not self.alive:
@@ -225,11 +392,26 @@ class Player:
 class Bullet:
     def __init__(self, x, y, direction):
         self.rect = pygame.Rect(x, y - 4, 12, 8)
+        self.swept = self.rect.copy()
         self.direction = direction
         self.speed = 10
+        self.spent = False
     
-    def update(self):
-        self.rect.x += self.speed * self.direction
+    def update(self, grid):
+        prev = self.rect.copy()
+        dx = self.speed * self.direction
+        hit = grid.sweep(self.rect, dx, 0)
+        if hit is None:
+            self.rect.x += dx
+        else:
+            if dx > 0:
+                self.rect.right = hit[1].left
+            else:
+                self.rect.left = hit[1].right
+            self.spent = True
+        # Hostile checks use the whole volume covered this tick so fast
+        # bullets cannot skip over a target between two frames.
+        self.swept = prev.union(self.rect)
     
     def draw(self, surface, camera_x):
         pygame.draw.ellipse(surface, CRAZY_YELLOW, (self.rect.x - camera_x, self.rect.y, 12, 8))
@@ -255,8 +437,9 @@ class Enemy:
             self.color = ENEMY_CYAN
         
         self.rect = pygame.Rect(x, y, self.width, self.height)
-        self.vel_x = ENEMY_SPEED
+        self.vel_x = units(ENEMY_SPEED)
         self.vel_y = 0
+        self.carry = [0, 0]
         self.direction = 1
         self.on_ground = False
         self.alive = True
@@ -264,54 +447,57 @@ class Enemy:
         self.rage_timer = 0
         self.spin_timer = 0
     
-    def update(self, tiles):
+    def update(self, grid):
         if not self.alive:
             return
         
         if self.type == 2:
             self.rage_timer += 1
             if self.rage_timer > 60:
-                self.vel_x = ENEMY_SPEED * 2.5
+                self.vel_x = units(ENEMY_SPEED * 2.5)
                 self.rage_timer = 0
         
         if self.type == 3:
             self.spin_timer += 1
             if self.spin_timer > 90:
                 self.spin_timer = 0
-                self.vel_x = ENEMY_SPEED * 3 if self.vel_x < ENEMY_SPEED * 2 else ENEMY_SPEED
+                self.vel_x = units(ENEMY_SPEED * 3) if self.vel_x < units(ENEMY_SPEED * 2) else units(ENEMY_SPEED)
         
-        self.vel_y += GRAVITY
-        if self.vel_y > MAX_FALL_SPEED:
-            self.vel_y = MAX_FALL_SPEED
+        self.vel_y += units(GRAVITY)
+        if self.vel_y > units(MAX_FALL_SPEED):
+            self.vel_y = units(MAX_FALL_SPEED)
         
-        self.rect.x += self.vel_x * self.direction
-        self.handle_horizontal_collision(tiles)
+        self.handle_horizontal_collision(grid)
         
-        self.rect.y += self.vel_y
         self.on_ground = False
-        self.handle_vertical_collision(tiles)
-    
-    def handle_horizontal_collision(self, tiles):
-        for tile in tiles:
-            if tile.type in (TILE_GROUND, TILE_BLOCK, TILE_PIPE, TILE_PIPE_TOP):
-                if self.rect.colliderect(tile.rect):
-                    if self.vel_x * self.direction > 0:
-                        self.rect.right = tile.rect.left
-                    else:
-                        self.rect.left = tile.rect.right
-                    self.direction *= -1
-    
-    def handle_vertical_collision(self, tiles):
-        for tile in tiles:
-            if tile.type in (TILE_GROUND, TILE_BLOCK, TILE_PIPE, TILE_PIPE_TOP):
-                if self.rect.colliderect(tile.rect):
-                    if self.vel_y > 0:
-                        self.rect.bottom = tile.rect.top
-                        self.vel_y = 0
-                        self.on_ground = True
-                    elif self.vel_y < 0:
-                        self.rect.top = tile.rect.bottom
-                        self.vel_y = 0
+        self.handle_vertical_collision(grid)
+    
+    def handle_horizontal_collision(self, grid):
+        dx = step(self, 0, self.vel_x * self.direction)
+        hit = grid.sweep(self.rect, dx, 0)
+        if hit is None:
+            move_rect(self, 0, dx)
+            return
+        if dx > 0:
+            self.rect.right = hit[1].left
+        else:
+            self.rect.left = hit[1].right
+        stop(self, 0)
+        self.direction *= -1
+    
+    def handle_vertical_collision(self, grid):
+        dy = step(self, 1, self.vel_y)
+        hit = grid.sweep(self.rect, 0, dy)
+        if hit is None:
+            move_rect(self, 1, dy)
+            return
+        if self.vel_y > 0:
+            self.rect.bottom = hit[1].top
+            self.on_ground = True
+        else:
+            self.rect.top = hit[1].bottom
+        self.vel_y = 0
+        stop(self, 1)
     
     def draw(self, surface, camera_x):
         if not self.alive:
@@ -336,6 +522,7 @@ class Enemy:
 class Ghost:
     def __init__(self, x, y):
         self.rect = pygame.Rect(x, y, 28, 32)
+        self.carry = [0, 0]
         self.start_x = x
         self.start_y = y
         self.alive = True
@@ -351,10 +538,9 @@ class Ghost:
         if player_rect:
             dx = player_rect.centerx - self.rect.centerx
             dy = player_rect.centery - self.rect.centery
-            dist = max(1, math.sqrt(dx*dx + dy*dy))
+            dist, vel_x, vel_y = toward(dx, dy, self.speed)
             if dist < 200:
-                self.rect.x += (dx / dist) * self.speed
-                self.rect.y += (dy / dist) * self.speed
+                move(self, vel_x, vel_y)
         
         self.phase = (self.timer // 10) % 2
     
@@ -377,37 +563,44 @@ class Slime:
         self.alive = True
         self.timer = 0
         self.jump_timer = 0
-        self.vel_x = 1
+        self.vel_x = units(1)
         self.vel_y = 0
+        self.carry = [0, 0]
         self.direction = 1
     
-    def update(self, tiles):
+    def update(self, grid):
         if not self.alive:
             return
         self.timer += 1
         
         if self.timer % 90 == 0:
-            self.vel_y = -8
+            self.vel_y = units(-8)
             self.direction *= -1
         
-        self.vel_x = self.direction * 1.5
-        self.vel_y += 0.3
-        
-        self.rect.x += self.vel_x
-        self.rect.y += self.vel_y
-        
-        for tile in tiles:
-            if tile.type in (TILE_GROUND, TILE_BLOCK, TILE_PIPE, TILE_PIPE_TOP):
-                if self.rect.colliderect(tile.rect):
-                    if self.vel_y > 0:
-                        self.rect.bottom = tile.rect.top
-                        self.vel_y = 0
-                    elif self.vel_x > 0:
-                        self.rect.right = tile.rect.left
-                        self.direction = -1
-                    elif self.vel_x < 0:
-                        self.rect.left = tile.rect.right
-                        self.direction = 1
+        self.vel_x = self.direction * units(1.5)
+        self.vel_y += units(0.3)
+        
+        dy = step(self, 1, self.vel_y)
+        hit = grid.sweep(self.rect, 0, dy)
+        if hit is None:
+            move_rect(self, 1, dy)
+        elif self.vel_y > 0:
+            self.rect.bottom = hit[1].top
+            self.vel_y = 0
+            stop(self, 1)
+        
+        dx = step(self, 0, self.vel_x)
+        hit = grid.sweep(self.rect, dx, 0)
+        if hit is None:
+            move_rect(self, 0, dx)
+        elif self.vel_x > 0:
+            self.rect.right = hit[1].left
+            self.direction = -1
+            stop(self, 0)
+        else:
+            self.rect.left = hit[1].right
+            self.direction = 1
+            stop(self, 0)
     
     def draw(self, surface, camera_x):
         if not self.alive:
@@ -433,7 +626,7 @@ class Teleporter:
         self.target_y = y
         self.lerp_progress = 0
     
-    def update(self, player_rect, tiles):
+    def update(self, player_rect, grid):
         if not self.alive:
             return
         self.timer += 1
@@ -443,15 +636,6 @@ class Teleporter:
             if self.teleport_timer == 15:
                 self.visible = False
                 self.scale = 0.1
-            elif self.teleport_timer == 5:
-                if player_rect:
-                    offset_x = random.choice([-150, -100, 100, 150])
-                    offset_y = random.choice([-80, -40, 40, 80])
-                    self.target_x = max(50, min(3800, player_rect.x + offset_x))
-                    self.target_y = max(50, min(500, player_rect.y + offset_y))
-                else:
-                    self.target_x = self.start_pos[0] + random.randint(-100, 100)
-                    self.target_y = self.start_pos[1] + random.randint(-50, 50)
             elif self.teleport_timer < 5:
                 self.rect.x = self.target_x
                 self.rect.y = self.target_y
@@ -459,6 +643,18 @@ class Teleporter:
                 self.scale = min(1.0, self.scale + 0.2)
         elif self.timer % 120 == 0:
             self.teleport_timer = 20
+            self.pick_target(player_rect, grid)
+    
+    def pick_target(self, player_rect, grid):
+        """Choose where the teleport just armed will land."""
+        if player_rect:
+            offset_x = random.choice([-150, -100, 100, 150])
+            offset_y = random.choice([-80, -40, 40, 80])
+            self.target_x = max(grid.left + 50, min(grid.right - 2 * TILE_SIZE, player_rect.x + offset_x))
+            self.target_y = max(50, min(500, player_rect.y + offset_y))
+        else:
+            self.target_x = self.start_pos[0] + random.randint(-100, 100)
+            self.target_y = self.start_pos[1] + random.randint(-50, 50)
     
     def draw(self, surface, camera_x):
         if not self.alive:
@@ -485,48 +681,54 @@ class Thief:
         self.has_stolen = False
         self.velocity_x = 0
         self.velocity_y = 0
+        self.carry = [0, 0]
         self.angle = 0
     
-    def update(self, player_rect, coins):
+    def update(self, player_rect):
         if not self.alive:
             return
         self.timer += 1
         self.angle += 0.2
-        dist = 1000
         
         if player_rect:
             dx = player_rect.centerx - self.rect.centerx
             dy = player_rect.centery - self.rect.centery
-            dist = max(1, math.sqrt(dx*dx + dy*dy))
+            dist, pull_x, pull_y = toward(dx, dy, 0.3)
             
             if dist < 200 and not self.has_stolen:
-                self.velocity_x += (dx / dist) * 0.3
-                self.velocity_y += (dy / dist) * 0.3
+                self.velocity_x += pull_x
+                self.velocity_y += pull_y
             elif self.has_stolen:
-                self.velocity_x -= (dx / dist) * 0.5
-                self.velocity_y -= (dy / dist) * 0.5
+                dist, push_x, push_y = toward(dx, dy, 0.5)
+                self.velocity_x -= push_x
+                self.velocity_y -= push_y
         
-        self.velocity_x *= 0.95
-        self.velocity_y *= 0.95
+        self.velocity_x = damp(self.velocity_x, 0.95)
+        self.velocity_y = damp(self.velocity_y, 0.95)
         
-        self.rect.x += self.velocity_x
-        self.rect.y += self.velocity_y + int(3 * math.sin(self.angle))
+        bob = wave(3, self.timer, 0.2) if FIXED_POINT else int(3 * math.sin(self.angle))
+        move(self, self.velocity_x, self.velocity_y + units(bob))
         
         if self.steal_timer > 0:
             self.steal_timer -= 1
         
-        if dist < 40 and self.steal_timer == 0 and not self.has_stolen:
-            if coins:
-                for coin in coins:
-                    if not coin.collected:
-                        coin.collected = True
-                        self.has_stolen = True
-                        self.steal_timer = 180
-                        break
-        
         if self.has_stolen and self.steal_timer < 150:
             self.has_stolen = False
     
+    def think(self, level, player_rect, bullets):
+        """Steal a coin when next to the player."""
+        if not player_rect or self.steal_timer or self.has_stolen:
+            return
+        dx = player_rect.centerx - self.rect.centerx
+        dy = player_rect.centery - self.rect.centery
+        if dx * dx + dy * dy < 40 * 40:
+            for coin in level.coins:
+                if not coin.collected:
+                    coin.collected = True
+                    self.has_stolen = True
+                    self.steal_timer = 180
+                    break
+    
     def draw(self, surface, camera_x):
         if not self.alive:
             return
@@ -553,10 +755,11 @@ class Dodger:
         self.velocity_y = 0
         self.dodge_x = 0
         self.dodge_y = 0
+        self.carry = [0, 0]
         self.dodging = False
         self.trail = []
     
-    def update(self, player_rect, bullets):
+    def update(self):
         if not self.alive:
             return
         self.timer += 1
@@ -568,39 +771,40 @@ class Dodger:
         if self.dodge_cooldown > 0:
             self.dodge_cooldown -= 1
         
-        if not self.dodging:
-            if player_rect:
-                target_x = player_rect.x
-                self.velocity_x = 1.5 if self.rect.x < target_x else -1.5
+        if self.dodging:
+            move(self, self.dodge_x, self.dodge_y)
+            self.dodge_x = damp(self.dodge_x, 0.9)
+            self.dodge_y = damp(self.dodge_y, 0.9)
+            if abs(self.dodge_x) < units(0.5) and abs(self.dodge_y) < units(0.5):
+                self.dodging = False
+        else:
+            move(self, self.velocity_x, units(wave(2, self.timer, 0.1)))
+    
+    def think(self, level, player_rect, bullets):
+        """Head for the player, or start dodging the first bullet that comes close."""
+        if self.dodging:
+            return
+        if player_rect:
+            self.velocity_x = units(1.5) if self.rect.x < player_rect.x else units(-1.5)
         
         for bullet in bullets:
             dx = bullet.rect.centerx - self.rect.centerx
             dy = bullet.rect.centery - self.rect.centery
-            dist = math.sqrt(dx*dx + dy*dy)
+            dist, dodge_x, dodge_y = toward(-dy, dx, 8)
             
-            if dist < 100 and self.dodge_cooldown == 0 and not self.dodging:
+            if dist < 100 and self.dodge_cooldown == 0:
                 self.dodging = True
                 self.dodge_cooldown = 60
-                self.dodge_x = -dy / dist * 8 if dist > 0 else 0
-                self.dodge_y = dx / dist * 8 if dist > 0 else 0
+                self.dodge_x = dodge_x
+                self.dodge_y = dodge_y
                 break
-        
-        if self.dodging:
-            self.rect.x += self.dodge_x
-            self.rect.y += self.dodge_y
-            self.dodge_x *= 0.9
-            self.dodge_y *= 0.9
-            if abs(self.dodge_x) < 0.5 and abs(self.dodge_y) < 0.5:
-                self.dodging = False
-        else:
-            self.rect.x += self.velocity_x
-            self.rect.y += int(2 * math.sin(self.timer * 0.1))
     
     def draw(self, surface, camera_x):
         if not self.alive:
             return
         
-        for i, (tx, ty) in enumerate(self.trail):
+        start = max(0, len(self.trail) - QUALITY["trail"])
+        for i, (tx, ty) in enumerate(self.trail[start:], start):
             alpha = i / len(self.trail)
             size = int(20 * alpha)
             color = (int(ANNOYING_PINK[0] * alpha), int(ANNOYING_PINK[1] * alpha), int(ANNOYING_PINK[2] * alpha))
@@ -622,22 +826,29 @@ class Shielder:
         self.timer = 0
         self.pulse = 0
         self.angle = 0
+        self.carry = [0, 0]
         self.shield_radius = 60
+        self.pursuit = None
     
-    def update(self, enemies, player_rect):
+    def update(self):
         if not self.alive:
             return
         self.timer += 1
         self.angle += 0.05
         self.pulse = int(5 * math.sin(self.timer * 0.1))
         
+        if self.pursuit:
+            move(self, *self.pursuit)
+    
+    def think(self, level, player_rect, bullets):
+        """Close in on the player while further than 150 px away."""
+        self.pursuit = None
         if player_rect:
             dx = player_rect.centerx - self.rect.centerx
             dy = player_rect.centery - self.rect.centery
-            dist = max(1, math.sqrt(dx*dx + dy*dy))
+            dist, vel_x, vel_y = toward(dx, dy, 0.8)
             if dist > 150:
-                self.rect.x += (dx / dist) * 0.8
-                self.rect.y += (dy / dist) * 0.8
+                self.pursuit = (vel_x, vel_y)
     
     def draw(self, surface, camera_x):
         if not self.alive:
@@ -646,7 +857,7 @@ class Shielder:
         
         pygame.draw.circle(surface, (150, 150, 200, 100), (draw_x + 16, self.rect.y + 16), self.shield_radius + self.pulse, 3)
         
-        for i in range(3):
+        for i in range(3 if QUALITY["effects"] else 0):
             angle = self.angle + i * 2.09
             sx = draw_x + 16 + int(40 * math.cos(angle))
             sy = self.rect.y + 16 + int(40 * math.sin(angle))
@@ -666,7 +877,7 @@ class Healer:
         self.bob_offset = 0
         self.heal_beams = []
     
-    def update(self, enemies):
+    def update(self):
         if not self.alive:
             return
         self.timer += 1
@@ -676,9 +887,13 @@ class Healer:
             self.heal_timer -= 1
         
         self.heal_beams = []
+    
+    def think(self, level, player_rect, bullets):
+        """Now and then beam a heal at an enemy in range, found through the level's x index."""
         if self.heal_timer == 0:
-            for enemy in enemies:
-                if enemy.alive and enemy != self:
+            nearby = level.entity_index.window(self.rect.centerx - 120 - TILE_SIZE, self.rect.centerx + 120)
+            for enemy in nearby:
+                if isinstance(enemy, Enemy) and enemy.alive:
                     dx = enemy.rect.centerx - self.rect.centerx
                     dy = enemy.rect.centery - self.rect.centery
                     dist = math.sqrt(dx*dx + dy*dy)
@@ -693,7 +908,7 @@ class Healer:
         draw_x = self.rect.x - camera_x
         draw_y = self.rect.y + self.bob_offset
         
-        for hx, hy in self.heal_beams:
+        for hx, hy in self.heal_beams if QUALITY["effects"] else ():
             pygame.draw.line(surface, (100, 255, 100), (draw_x + 13, draw_y + 15), (hx - camera_x, hy), 3)
             pygame.draw.circle(surface, (100, 255, 100), (hx - camera_x, hy), 8)
         
@@ -739,8 +954,9 @@ class Bat:
 
 
 class Boss:
-    def __init__(self, x, y, boss_type=0):
+    def __init__(self, x, y, boss_type=0, arena=(100, 700)):
         self.type = boss_type
+        self.arena = arena
         self.width = 64
         self.height = 80
         self.rect = pygame.Rect(x, y, self.width, self.height)
@@ -766,14 +982,14 @@ class Boss:
             self.name = "DRAGON"
             self.color = ENEMY_RED
     
-    def update(self, player_rect, tiles):
+    def update(self, player_rect, grid):
         if not self.alive:
             return
         
         self.timer += 1
         
         self.rect.x += self.vel_x
-        if self.rect.left < 100 or self.rect.right > 700:
+        if self.rect.left < self.arena[0] or self.rect.right > self.arena[1]:
             self.vel_x *= -1
         
         if self.timer % 120 == 0:
@@ -789,7 +1005,7 @@ class Boss:
                     self.attacks.append(attack)
         
         for attack in self.attacks[:]:
-            attack.update(tiles)
+            attack.update(grid)
             if not attack.alive:
                 self.attacks.remove(attack)
     
@@ -883,6 +1099,7 @@ class SpikeTrap:
 class FallingSpike:
     def __init__(self, x, y):
         self.rect = pygame.Rect(x, y, 24, 24)
+        self.swept = self.rect.copy()
         self.start_y = y
         self.falling = False
         self.timer = 0
@@ -892,11 +1109,14 @@ class FallingSpike:
         if not self.falling and self.timer > 60:
             self.falling = True
         if self.falling:
+            prev = self.rect.copy()
             self.rect.y += 8
+            self.swept = prev.union(self.rect)
             if self.rect.y > SCREEN_HEIGHT + 100:
                 self.rect.y = self.start_y
                 self.falling = False
                 self.timer = 0
+                self.swept = self.rect.copy()
     
     def draw(self, surface, camera_x):
         points = [(self.rect.x - camera_x, self.rect.y + 24),
@@ -924,40 +1144,407 @@ class MovingPlatform:
 
 
 class Tile:
+    """Read-only view of one non-empty TileGrid cell; the grid owns the data."""
+    __slots__ = ("col", "row", "type")
+    
     def __init__(self, x, y, tile_type):
-        self.rect = pygame.Rect(x * TILE_SIZE, y * TILE_SIZE, TILE_SIZE, TILE_SIZE)
+        self.col = x
+        self.row = y
         self.type = tile_type
     
+    @property
+    def rect(self):
+        return pygame.Rect(self.col * TILE_SIZE, self.row * TILE_SIZE, TILE_SIZE, TILE_SIZE)
+    
     def draw(self, surface, camera_x):
         draw_x = self.rect.x - camera_x
         if draw_x + TILE_SIZE < 0 or draw_x > SCREEN_WIDTH:
             return
-        
-        if self.type == TILE_GROUND:
-            pygame.draw.rect(surface, GROUND_BROWN, (draw_x, self.rect.y, TILE_SIZE, TILE_SIZE))
-            pygame.draw.rect(surface, (100, 50, 10), (draw_x, self.rect.y, TILE_SIZE, 4))
-        elif self.type == TILE_BLOCK:
-            pygame.draw.rect(surface, BRICK_COLOR, (draw_x, self.rect.y, TILE_SIZE, TILE_SIZE))
-            pygame.draw.rect(surface, (150, 100, 70), (draw_x, self.rect.y, TILE_SIZE, 2))
-        elif self.type == TILE_PIPE:
-            pygame.draw.rect(surface, PIPE_GREEN, (draw_x, self.rect.y, TILE_SIZE, TILE_SIZE))
-        elif self.type == TILE_PIPE_TOP:
-            pygame.draw.rect(surface, PIPE_GREEN, (draw_x, self.rect.y, TILE_SIZE, TILE_SIZE // 2))
-        elif self.type == TILE_SPIKE:
-            points = [(draw_x, self.rect.y + TILE_SIZE), (draw_x + 16, self.rect.y), (draw_x + 32, self.rect.y + TILE_SIZE)]
-            pygame.draw.polygon(surface, SPIKE_GRAY, points)
-        elif self.type == TILE_SPIKE_UP:
-            points = [(draw_x, self.rect.y), (draw_x + 16, self.rect.y + TILE_SIZE), (draw_x + 32, self.rect.y)]
-            pygame.draw.polygon(surface, ANGRY_RED, points)
-        elif self.type == TILE_FLAG:
-            pygame.draw.rect(surface, FLAG_POLE, (draw_x + 14, self.rect.y, 4, TILE_SIZE))
-            pygame.draw.polygon(surface, FLAG_RED, [(draw_x + 18, self.rect.y), (draw_x + 30, self.rect.y + 8), (draw_x + 18, self.rect.y + 16)])
-        elif self.type == TILE_BOSS_DOOR:
-            pygame.draw.rect(surface, BOSS_DARK, (draw_x, self.rect.y, TILE_SIZE, TILE_SIZE))
-            pygame.draw.rect(surface, TRAP_RED, (draw_x + 8, self.rect.y + 8, 16, 16))
-
-
-def generate_level(level_num, width_tiles=60, is_boss_level=False):
+        draw_tile(surface, self.type, draw_x, self.rect.y)
+
+
+def draw_tile(surface, tile_type, draw_x, y):
+    if tile_type == TILE_GROUND:
+        pygame.draw.rect(surface, GROUND_BROWN, (draw_x, y, TILE_SIZE, TILE_SIZE))
+        pygame.draw.rect(surface, (100, 50, 10), (draw_x, y, TILE_SIZE, 4))
+    elif tile_type == TILE_BLOCK:
+        pygame.draw.rect(surface, BRICK_COLOR, (draw_x, y, TILE_SIZE, TILE_SIZE))
+        pygame.draw.rect(surface, (150, 100, 70), (draw_x, y, TILE_SIZE, 2))
+    elif tile_type == TILE_PIPE:
+        pygame.draw.rect(surface, PIPE_GREEN, (draw_x, y, TILE_SIZE, TILE_SIZE))
+    elif tile_type == TILE_PIPE_TOP:
+        pygame.draw.rect(surface, PIPE_GREEN, (draw_x, y, TILE_SIZE, TILE_SIZE // 2))
+    elif tile_type == TILE_SPIKE:
+        points = [(draw_x, y + TILE_SIZE), (draw_x + 16, y), (draw_x + 32, y + TILE_SIZE)]
+        pygame.draw.polygon(surface, SPIKE_GRAY, points)
+    elif tile_type == TILE_SPIKE_UP:
+        points = [(draw_x, y), (draw_x + 16, y + TILE_SIZE), (draw_x + 32, y)]
+        pygame.draw.polygon(surface, ANGRY_RED, points)
+    elif tile_type == TILE_FLAG:
+        pygame.draw.rect(surface, FLAG_POLE, (draw_x + 14, y, 4, TILE_SIZE))
+        pygame.draw.polygon(surface, FLAG_RED, [(draw_x + 18, y), (draw_x + 30, y + 8), (draw_x + 18, y + 16)])
+    elif tile_type == TILE_BOSS_DOOR:
+        pygame.draw.rect(surface, BOSS_DARK, (draw_x, y, TILE_SIZE, TILE_SIZE))
+        pygame.draw.rect(surface, TRAP_RED, (draw_x + 8, y + 8, 16, 16))
+
+
+def sweep_aabb(rect, dx, dy, other):
+    """Time of impact in [0, 1] of rect moving by (dx, dy) into other, or None.
+    
+    A rect that already overlaps other hits it at time 0.
+    """
+    if dx > 0:
+        x_entry = (other.left - rect.right) / dx
+        x_exit = (other.right - rect.left) / dx
+    elif dx < 0:
+        x_entry = (other.right - rect.left) / dx
+        x_exit = (other.left - rect.right) / dx
+    elif rect.right <= other.left or rect.left >= other.right:
+        return None
+    else:
+        x_entry, x_exit = -math.inf, math.inf
+    
+    if dy > 0:
+        y_entry = (other.top - rect.bottom) / dy
+        y_exit = (other.bottom - rect.top) / dy
+    elif dy < 0:
+        y_entry = (other.bottom - rect.top) / dy
+        y_exit = (other.top - rect.bottom) / dy
+    elif rect.bottom <= other.top or rect.top >= other.bottom:
+        return None
+    else:
+        y_entry, y_exit = -math.inf, math.inf
+    
+    entry = max(x_entry, y_entry)
+    if entry < 0 < min(x_exit, y_exit):
+        return 0.0
+    if entry < 0 or entry > 1 or entry >= min(x_exit, y_exit):
+        return None
+    return entry
+
+
+class TileGrid:
+    """Solid-cell lookups and swept collision queries over a level map.
+    
+    Each row is packed into a bytearray of tile ids, one byte per cell, and
+    rectangles are built on demand, so a cell costs a byte instead of a Tile
+    object.  Columns are addressed in world coordinates; ``col_offset`` is
+    the world column of the first stored column so streamed levels can drop
+    columns from the front without renumbering the rest.
+    """
+    
+    def __init__(self, map_data, col_offset=0):
+        self.map = [bytearray(row) for row in map_data]
+        self.rows = len(map_data)
+        self.cols = len(map_data[0]) if map_data else 0
+        self.col_offset = col_offset
+    
+    @property
+    def left(self):
+        return self.col_offset * TILE_SIZE
+    
+    @property
+    def right(self):
+        return (self.col_offset + self.cols) * TILE_SIZE
+    
+    def tile_at(self, col, row):
+        col -= self.col_offset
+        if 0 <= row < self.rows and 0 <= col < self.cols:
+            return self.map[row][col]
+        return TILE_EMPTY
+    
+    def is_solid(self, col, row):
+        return self.tile_at(col, row) in SOLID_TILES
+    
+    def cell_rect(self, col, row):
+        return pygame.Rect(col * TILE_SIZE, row * TILE_SIZE, TILE_SIZE, TILE_SIZE)
+    
+    def tiles(self):
+        """Tile views of every non-empty cell, row by row."""
+        for row, map_row in enumerate(self.map):
+            for col, tile_type in enumerate(map_row, self.col_offset):
+                if tile_type != TILE_EMPTY:
+                    yield Tile(col, row, tile_type)
+    
+    def cells_overlapping(self, rect):
+        """(col, row) of every in-bounds cell that rect overlaps."""
+        col_start = max(self.col_offset, rect.left // TILE_SIZE)
+        col_end = min(self.col_offset + self.cols - 1, (rect.right - 1) // TILE_SIZE)
+        row_start = max(0, rect.top // TILE_SIZE)
+        row_end = min(self.rows - 1, (rect.bottom - 1) // TILE_SIZE)
+        return [(col, row) for row in range(row_start, row_end + 1) for col in range(col_start, col_end + 1)]
+    
+    def append_columns(self, map_data):
+        for row, new_cells in zip(self.map, map_data):
+            row.extend(new_cells)
+        self.cols += len(map_data[0])
+    
+    def evict_columns(self, count):
+        for row in self.map:
+            del row[:count]
+        self.cols -= count
+        self.col_offset += count
+    
+    def sweep(self, rect, dx, dy):
+        """Earliest solid tile hit by rect moving (dx, dy) as (toi, tile_rect), or None.
+        
+        Only the cells covered by the swept box are tested, so the cost depends
+        on the distance travelled rather than on the size of the level.
+        """
+        if dx == 0 and dy == 0:
+            return None
+        left, top, right, bottom = rect.left, rect.top, rect.right, rect.bottom
+        if dx < 0:
+            left += dx
+        else:
+            right += dx
+        if dy < 0:
+            top += dy
+        else:
+            bottom += dy
+        # Every entity sweeps every tick, so the cell range is clamped with
+        # plain comparisons rather than min/max/ceil calls.
+        offset = self.col_offset
+        col_start = int(left // TILE_SIZE) - offset
+        col_end = -int(-right // TILE_SIZE) - 1 - offset
+        row_start = int(top // TILE_SIZE)
+        row_end = -int(-bottom // TILE_SIZE) - 1
+        if col_start < 0:
+            col_start = 0
+        if col_end >= self.cols:
+            col_end = self.cols - 1
+        if row_start < 0:
+            row_start = 0
+        if row_end >= self.rows:
+            row_end = self.rows - 1
+        
+        best = None
+        for row in range(row_start, row_end + 1):
+            map_row = self.map[row]
+            for col in range(col_start, col_end + 1):
+                if map_row[col] not in SOLID_TILES:
+                    continue
+                cell = self.cell_rect(col + offset, row)
+                toi = sweep_aabb(rect, dx, dy, cell)
+                if toi is not None and (best is None or toi < best[0]):
+                    best = (toi, cell)
+        return best
+
+
+HAZARD_TILES = (TILE_SPIKE, TILE_SPIKE_UP)
+
+
+def _jump_arcs():
+    """Cell footprints of every jump the player can make from a standing start.
+    
+    Each arc follows Player.update exactly (JUMP_FORCE, optional
+    DOUBLE_JUMP_FORCE, GRAVITY, MAX_FALL_SPEED, PLAYER_SPEED) and is stored as
+    one (dcol_lo, dcol_hi, drow_lo, drow_hi, center_dcol, falling) entry per
+    tick, relative to the cell the player launched from.
+    """
+    arcs = []
+    for direction in (-1, 1):
+        for double_jump_tick in (None, 4, 8, 12, 16, 20, 24):
+            left = 4
+            top = 0
+            vel_y = JUMP_FORCE
+            steps = []
+            for tick in range(1, 90):
+                left += PLAYER_SPEED * direction
+                if tick == double_jump_tick:
+                    vel_y = DOUBLE_JUMP_FORCE
+                vel_y = min(vel_y + GRAVITY, MAX_FALL_SPEED)
+                # pygame.Rect rounds every assignment half away from zero.
+                moved = top + vel_y
+                top = int(moved + 0.5) if moved >= 0 else -int(-moved + 0.5)
+                step = (left // TILE_SIZE, (left + 23) // TILE_SIZE,
+                        top // TILE_SIZE, (top + 31) // TILE_SIZE,
+                        (left + 12) // TILE_SIZE, vel_y > 0)
+                # Ticks that cover the same cells add nothing to the cell-level check.
+                if not steps or steps[-1] != step:
+                    steps.append(step)
+            arcs.append(steps)
+    return arcs
+
+
+JUMP_ARCS = _jump_arcs()
+
+
+def _shift_cols(mask, dcol):
+    """Bit c of the result is bit c + dcol of mask."""
+    return mask >> dcol if dcol >= 0 else mask << -dcol
+
+
+class ReachabilityGraph:
+    """Which standable cells the player can reach from the spawn point.
+    
+    A cell is standable when it is free and the cell below it is solid.  Every
+    row is held as an int bitmask over columns, so one bitwise operation
+    handles every column of the row at once.  Jumps from the precomputed
+    JUMP_ARCS become ``transfers`` (row, launch_mask, dcol, drow): the graph's
+    jump edges for every launch column in launch_mask.  Walking and dropping
+    off ledges are applied as flood fills.  Moving platforms and hostiles are
+    ignored and any contact with a wall ends an arc, which keeps the check
+    conservative.
+    """
+    
+    def __init__(self, map_data, spawn_col, goal_col, masks=None):
+        self.rows = len(map_data)
+        self.cols = len(map_data[0]) if map_data else 0
+        self.goal_col = goal_col
+        self.full = (1 << self.cols) - 1
+        if masks is not None:
+            self.solid, self.hazard = masks
+        else:
+            self.solid = []
+            self.hazard = []
+            for row in map_data:
+                solid = hazard = 0
+                for col, tile in enumerate(row):
+                    if tile in SOLID_TILES:
+                        solid |= 1 << col
+                    elif tile in HAZARD_TILES:
+                        hazard |= 1 << col
+                self.solid.append(solid)
+                self.hazard.append(hazard)
+        self.free = [self.full & ~(solid | hazard) for solid, hazard in zip(self.solid, self.hazard)]
+        self.standable = [self.free[r] & self.solid[r + 1] for r in range(self.rows - 1)] + [0]
+        
+        self.transfers = self._build_transfers()
+        self.reachable = [0] * self.rows
+        start = self._spawn_cell(spawn_col)
+        if start is not None:
+            self.reachable[start[1]] = 1 << start[0]
+            self._explore()
+        self.frontier_col = max(mask.bit_length() for mask in self.reachable) - 1
+        self.solvable = self.frontier_col >= goal_col
+    
+    def _spawn_cell(self, col):
+        for row in range(self.rows):
+            if not self.free[row] >> col & 1:
+                return None
+            if self.standable[row] >> col & 1:
+                return (col, row)
+        return None
+    
+    def _footprint(self, cache, masks, row, dcol_lo, dcol_hi):
+        """OR of masks[row] shifted by every dcol in [dcol_lo, dcol_hi], memoized in cache."""
+        key = (row, dcol_lo, dcol_hi)
+        value = cache.get(key)
+        if value is None:
+            value = 0
+            if 0 <= row < self.rows:
+                for dcol in range(dcol_lo, dcol_hi + 1):
+                    value |= _shift_cols(masks[row], dcol)
+            cache[key] = value
+        return value
+    
+    def _build_transfers(self):
+        transfers = []
+        walls = [solid | hazard for solid, hazard in zip(self.solid, self.hazard)]
+        wall_cache = {}
+        hazard_cache = {}
+        floor_cache = {}
+        for row in range(self.rows):
+            if not self.standable[row]:
+                continue
+            for arc in JUMP_ARCS:
+                alive = self.standable[row]
+                for dcol_lo, dcol_hi, drow_lo, drow_hi, center, falling in arc:
+                    bottom = row + drow_hi
+                    if bottom >= self.rows:
+                        break
+                    blocked = 0
+                    for r in range(row + drow_lo, bottom if falling else bottom + 1):
+                        blocked |= self._footprint(wall_cache, walls, r, dcol_lo, dcol_hi)
+                    if falling:
+                        blocked |= self._footprint(hazard_cache, self.hazard, bottom, dcol_lo, dcol_hi)
+                    alive &= ~blocked
+                    if not alive:
+                        break
+                    if not falling:
+                        continue
+                    landed = 0
+                    for dcol in [center] + [d for d in range(dcol_lo, dcol_hi + 1) if d != center]:
+                        launch = alive & self._footprint(floor_cache, self.solid, bottom, dcol, dcol) & ~landed
+                        if launch:
+                            transfers.append((row, launch, dcol, drow_hi - 1))
+                            landed |= launch
+                    alive &= ~landed
+        return transfers
+    
+    def _spread(self, row):
+        """Walk and drop from the reached cells of row until nothing new is reached."""
+        reached = self.reachable[row]
+        standable = self.standable[row]
+        while True:
+            grown = reached | ((reached << 1) | (reached >> 1)) & standable
+            if grown == reached:
+                break
+            reached = grown
+        self.reachable[row] = reached
+        
+        falling = ((reached << 1) | (reached >> 1)) & self.free[row] & ~standable & self.full
+        r = row
+        while falling and r + 1 < self.rows:
+            r += 1
+            falling &= self.free[r]
+            landed = falling & self.standable[r]
+            if landed & ~self.reachable[r]:
+                self.reachable[r] |= landed
+            falling &= ~landed
+    
+    def _explore(self):
+        changed = True
+        while changed:
+            changed = False
+            for row in range(self.rows):
+                if self.reachable[row]:
+                    self._spread(row)
+            for row, launch, dcol, drow in self.transfers:
+                source = self.reachable[row] & launch
+                if not source:
+                    continue
+                target = _shift_cols(source, -dcol) & self.standable[row + drow]
+                if target & ~self.reachable[row + drow]:
+                    self.reachable[row + drow] |= target
+                    changed = True
+    
+    def reachable_cells(self):
+        for row, mask in enumerate(self.reachable):
+            col = 0
+            while mask:
+                if mask & 1:
+                    yield (col, row)
+                mask >>= 1
+                col += 1
+
+
+def repair_level_map(map_data, ground_row, spawn_col, goal_col, span=4, graph=None):
+    """Flatten obstacles past the reachable frontier until the goal can be reached.
+    
+    Returns the final ReachabilityGraph.  Each pass fills pits, removes floor
+    spikes and pipes over ``span`` columns past the furthest reachable column.
+    An already built graph for map_data can be passed to skip the first build.
+    """
+    if graph is None:
+        graph = ReachabilityGraph(map_data, spawn_col, goal_col)
+    width = len(map_data[0])
+    while not graph.solvable:
+        first = max(graph.frontier_col + 1, spawn_col)
+        for col in range(first, min(width, first + span)):
+            map_data[ground_row][col] = TILE_GROUND
+            map_data[ground_row + 1][col] = TILE_GROUND
+            for row in range(ground_row):
+                if map_data[row][col] in (TILE_PIPE, TILE_PIPE_TOP, TILE_SPIKE, TILE_SPIKE_UP):
+                    map_data[row][col] = TILE_EMPTY
+        graph = ReachabilityGraph(map_data, spawn_col, goal_col)
+        if first + span >= width:
+            break
+    return graph
+
+
+def generate_level(level_num, width_tiles=60, is_boss_level=False, rng=random):
     level_width = width_tiles
     ground_row = 14
     map_data = [[0] * level_width for _ in range(18)]
@@ -971,90 +1558,223 @@ def generate_level(level_num, width_tiles=60, is_boss_level=False):
     if not is_boss_level:
         for seg in range(5):
             seg_start = 3 + seg * ((level_width - 10) // 5)
-            pit_col = seg_start + random.randint(2, 6)
-            pit_width = random.randint(1, 2)
+            pit_col = seg_start + rng.randint(2, 6)
+            pit_width = rng.randint(1, 2)
             for p in range(pit_width):
                 if pit_col + p < level_width - 3:
                     map_data[ground_row][pit_col + p] = TILE_EMPTY
                     map_data[ground_row + 1][pit_col + p] = TILE_EMPTY
     
     for _ in range(3 + level_num):
-        pipe_col = random.randint(8, level_width - 8)
-        pipe_height = random.randint(2, 3)
+        pipe_col = rng.randint(8, level_width - 8)
+        pipe_height = rng.randint(2, 3)
         for h in range(pipe_height):
             if ground_row - h >= 0:
                 map_data[ground_row - h][pipe_col] = TILE_PIPE_TOP if h == 0 else TILE_PIPE
     
     for _ in range(6 + level_num * 2):
-        plat_col = random.randint(4, level_width - 6)
-        plat_row = random.randint(9, 12)
-        for w in range(random.randint(2, 3)):
+        plat_col = rng.randint(4, level_width - 6)
+        plat_row = rng.randint(9, 12)
+        for w in range(rng.randint(2, 3)):
             if plat_col + w < level_width - 3 and map_data[plat_row][plat_col + w] == 0:
                 map_data[plat_row][plat_col + w] = TILE_BLOCK
     
     for col in range(4, level_width - 4):
-        if random.random() < 0.06 and map_data[ground_row][col] == TILE_GROUND:
+        if rng.random() < 0.06 and map_data[ground_row][col] == TILE_GROUND:
             map_data[ground_row][col] = TILE_SPIKE_UP
     
+    boss_door_x = level_width - 3
+    reachability = repair_level_map(map_data, ground_row, 100 // TILE_SIZE, boss_door_x)
+    
     coin_positions = []
     for _ in range(10 + level_num * 2):
-        coin_positions.append((random.randint(2, level_width - 3), random.randint(11, 13)))
+        coin_positions.append((rng.randint(2, level_width - 3), rng.randint(11, 13)))
     
     enemy_positions = []
     for _ in range(8 + level_num * 3):
-        enemy_col = random.randint(5, level_width - 5)
+        enemy_col = rng.randint(5, level_width - 5)
         if map_data[ground_row][enemy_col] == TILE_GROUND:
-            enemy_positions.append((enemy_col, ground_row - 1, random.randint(0, 5)))
+            enemy_positions.append((enemy_col, ground_row - 1, rng.randint(0, 5)))
     
     bat_positions = []
     for _ in range(3 + level_num):
-        bat_positions.append((random.randint(10, level_width - 15) * TILE_SIZE, random.randint(3, 7) * TILE_SIZE))
+        bat_positions.append((rng.randint(10, level_width - 15) * TILE_SIZE, rng.randint(3, 7) * TILE_SIZE))
     
     moving_platforms = []
     for _ in range(2 + level_num // 2):
-        moving_platforms.append((random.randint(8, level_width - 10), random.randint(7, 11), random.randint(2, 3)))
+        moving_platforms.append((rng.randint(8, level_width - 10), rng.randint(7, 11), rng.randint(2, 3)))
     
     trap_positions = []
     for _ in range(2 + level_num):
-        trap_col = random.randint(6, level_width - 6)
-        trap_row = random.randint(3, 12)
-        trap_positions.append((trap_col * TILE_SIZE, trap_row * TILE_SIZE, random.randint(0, 1)))
+        trap_col = rng.randint(6, level_width - 6)
+        trap_row = rng.randint(3, 12)
+        trap_positions.append((trap_col * TILE_SIZE, trap_row * TILE_SIZE, rng.randint(0, 1)))
     
     falling_spikes = []
     for _ in range(1 + level_num):
-        falling_spikes.append((random.randint(8, level_width - 8) * TILE_SIZE, -50))
+        falling_spikes.append((rng.randint(8, level_width - 8) * TILE_SIZE, -50))
     
     ghost_positions = []
     for _ in range(2 + level_num):
-        ghost_positions.append((random.randint(10, level_width - 15) * TILE_SIZE, random.randint(2, 6) * TILE_SIZE))
+        ghost_positions.append((rng.randint(10, level_width - 15) * TILE_SIZE, rng.randint(2, 6) * TILE_SIZE))
     
     slime_positions = []
     for _ in range(2 + level_num):
-        slime_col = random.randint(5, level_width - 5)
+        slime_col = rng.randint(5, level_width - 5)
         if map_data[ground_row][slime_col] == TILE_GROUND:
             slime_positions.append((slime_col * TILE_SIZE, (ground_row - 2) * TILE_SIZE))
     
     teleporter_positions = []
     for _ in range(1 + level_num // 2):
-        teleporter_positions.append((random.randint(8, level_width - 10) * TILE_SIZE, random.randint(3, 8) * TILE_SIZE))
+        teleporter_positions.append((rng.randint(8, level_width - 10) * TILE_SIZE, rng.randint(3, 8) * TILE_SIZE))
     
     thief_positions = []
     for _ in range(1 + level_num // 3):
-        thief_positions.append((random.randint(10, level_width - 15) * TILE_SIZE, random.randint(4, 10) * TILE_SIZE))
+        thief_positions.append((rng.randint(10, level_width - 15) * TILE_SIZE, rng.randint(4, 10) * TILE_SIZE))
     
     dodger_positions = []
     for _ in range(2 + level_num // 2):
-        dodger_positions.append((random.randint(8, level_width - 10) * TILE_SIZE, random.randint(5, 12) * TILE_SIZE))
+        dodger_positions.append((rng.randint(8, level_width - 10) * TILE_SIZE, rng.randint(5, 12) * TILE_SIZE))
     
     shielder_positions = []
     for _ in range(1 + level_num // 3):
-        shielder_positions.append((random.randint(12, level_width - 15) * TILE_SIZE, random.randint(6, 11) * TILE_SIZE))
+        shielder_positions.append((rng.randint(12, level_width - 15) * TILE_SIZE, rng.randint(6, 11) * TILE_SIZE))
     
     healer_positions = []
     for _ in range(1 + level_num // 4):
-        healer_positions.append((random.randint(10, level_width - 12) * TILE_SIZE, random.randint(5, 10) * TILE_SIZE))
+        healer_positions.append((rng.randint(10, level_width - 12) * TILE_SIZE, rng.randint(5, 10) * TILE_SIZE))
+    
+    boss_arena = (boss_door_x * TILE_SIZE - SCREEN_WIDTH + 100, boss_door_x * TILE_SIZE - 100)
+    
+    return {
+        "name": f"Level {level_num}" + (" - BOSS!" if is_boss_level else ""),
+        "sky_color": sky_color,
+        "map": map_data,
+        "coins": coin_positions,
+        "enemies": enemy_positions,
+        "bats": bat_positions,
+        "ghosts": ghost_positions,
+        "slimes": slime_positions,
+        "teleporters": teleporter_positions,
+        "thieves": thief_positions,
+        "dodgers": dodger_positions,
+        "shielders": shielder_positions,
+        "healers": healer_positions,
+        "moving_platforms": moving_platforms,
+        "traps": trap_positions,
+        "falling_spikes": falling_spikes,
+        "boss_door_x": boss_door_x,
+        "boss_arena": boss_arena,
+        "reachability": reachability,
+        "is_boss_level": is_boss_level,
+        "boss_type": (level_num - 1) // 3 if is_boss_level else None,
+    }
+
+
+def _row_bitmasks(mask):
+    """One int per row of a 2D boolean array, bit c set where column c is True."""
+    packed = np.packbits(mask, axis=1, bitorder="little")
+    return [int.from_bytes(row.tobytes(), "little") for row in packed]
+
+
+def generate_level_np(level_num, width_tiles=60, is_boss_level=False, rng=random):
+    """Vectorized generate_level producing the same level schema.
+    
+    The tile grid is built as a uint8 array with masks for pits, pipes,
+    platforms and spikes, and every spawn table is sampled in bulk and
+    filtered against the ground row in one step.  The numpy stream is seeded
+    from rng, so results are reproducible but differ from generate_level.
+    Falls back to generate_level when numpy is not installed.
+    """
+    if np is None:
+        return generate_level(level_num, width_tiles, is_boss_level, rng)
+    
+    gen = np.random.default_rng(rng.getrandbits(64))
+    level_width = width_tiles
+    ground_row = 14
+    grid = np.zeros((18, level_width), dtype=np.uint8)
+    
+    sky_color = [(107, 140, 255), (100, 130, 230), (80, 100, 200), (60, 60, 80), (80, 60, 60)][(level_num - 1) % 5]
+    
+    grid[ground_row:ground_row + 2, :] = TILE_GROUND
+    
+    if not is_boss_level:
+        seg_start = 3 + np.arange(5) * ((level_width - 10) // 5)
+        pit_col = seg_start + gen.integers(2, 7, 5)
+        pit_width = gen.integers(1, 3, 5)
+        pit_cells = pit_col[:, None] + np.arange(2)
+        pit_cells = pit_cells[(np.arange(2) < pit_width[:, None]) & (pit_cells < level_width - 3)]
+        grid[ground_row:ground_row + 2, pit_cells] = TILE_EMPTY
+    
+    pipe_count = 3 + level_num
+    pipe_col = gen.integers(8, level_width - 7, pipe_count)
+    pipe_height = gen.integers(2, 4, pipe_count)
+    for h in range(3):
+        cols = pipe_col[pipe_height > h]
+        grid[ground_row - h, cols] = TILE_PIPE_TOP if h == 0 else TILE_PIPE
+    
+    plat_count = 6 + level_num * 2
+    plat_col = gen.integers(4, level_width - 5, plat_count)
+    plat_row = gen.integers(9, 13, plat_count)
+    plat_width = gen.integers(2, 4, plat_count)
+    for w in range(3):
+        cols = plat_col + w
+        keep = (plat_width > w) & (cols < level_width - 3)
+        rows, cols = plat_row[keep], cols[keep]
+        rows, cols = rows[grid[rows, cols] == TILE_EMPTY], cols[grid[rows, cols] == TILE_EMPTY]
+        grid[rows, cols] = TILE_BLOCK
+    
+    spike_band = grid[ground_row, 4:level_width - 4]
+    spike_band[(gen.random(spike_band.shape[0]) < 0.06) & (spike_band == TILE_GROUND)] = TILE_SPIKE_UP
     
     boss_door_x = level_width - 3
+    map_data = grid.tolist()
+    spawn_col = 100 // TILE_SIZE
+    solid = np.isin(grid, SOLID_TILES)
+    hazard = np.isin(grid, HAZARD_TILES)
+    reachability = ReachabilityGraph(map_data, spawn_col, boss_door_x, (_row_bitmasks(solid), _row_bitmasks(hazard)))
+    if not reachability.solvable:
+        reachability = repair_level_map(map_data, ground_row, spawn_col, boss_door_x, graph=reachability)
+        grid = np.array(map_data, dtype=np.uint8)
+    on_ground = grid[ground_row] == TILE_GROUND
+    
+    def cols(lo, hi, n):
+        return gen.integers(lo, hi + 1, n)
+    
+    def pixels(lo_col, hi_col, lo_row, hi_row, n):
+        return list(zip((cols(lo_col, hi_col, n) * TILE_SIZE).tolist(), (cols(lo_row, hi_row, n) * TILE_SIZE).tolist()))
+    
+    n = 10 + level_num * 2
+    coin_positions = list(zip(cols(2, level_width - 3, n).tolist(), cols(11, 13, n).tolist()))
+    
+    n = 8 + level_num * 3
+    enemy_col = cols(5, level_width - 5, n)
+    enemy_type = cols(0, 5, n)
+    keep = on_ground[enemy_col]
+    enemy_positions = [(col, ground_row - 1, etype) for col, etype in zip(enemy_col[keep].tolist(), enemy_type[keep].tolist())]
+    
+    bat_positions = pixels(10, level_width - 15, 3, 7, 3 + level_num)
+    
+    n = 2 + level_num // 2
+    moving_platforms = list(zip(cols(8, level_width - 10, n).tolist(), cols(7, 11, n).tolist(), cols(2, 3, n).tolist()))
+    
+    n = 2 + level_num
+    trap_positions = [(x, y, ttype) for (x, y), ttype in zip(pixels(6, level_width - 6, 3, 12, n), cols(0, 1, n).tolist())]
+    
+    falling_spikes = [(x, -50) for x in (cols(8, level_width - 8, 1 + level_num) * TILE_SIZE).tolist()]
+    
+    ghost_positions = pixels(10, level_width - 15, 2, 6, 2 + level_num)
+    
+    slime_col = cols(5, level_width - 5, 2 + level_num)
+    slime_positions = [(col * TILE_SIZE, (ground_row - 2) * TILE_SIZE) for col in slime_col[on_ground[slime_col]].tolist()]
+    
+    teleporter_positions = pixels(8, level_width - 10, 3, 8, 1 + level_num // 2)
+    thief_positions = pixels(10, level_width - 15, 4, 10, 1 + level_num // 3)
+    dodger_positions = pixels(8, level_width - 10, 5, 12, 2 + level_num // 2)
+    shielder_positions = pixels(12, level_width - 15, 6, 11, 1 + level_num // 3)
+    healer_positions = pixels(10, level_width - 12, 5, 10, 1 + level_num // 4)
+    
+    boss_arena = (boss_door_x * TILE_SIZE - SCREEN_WIDTH + 100, boss_door_x * TILE_SIZE - 100)
     
     return {
         "name": f"Level {level_num}" + (" - BOSS!" if is_boss_level else ""),
@@ -1074,16 +1794,20 @@ def generate_level(level_num, width_tiles=60, is_boss_level=False):
         "traps": trap_positions,
         "falling_spikes": falling_spikes,
         "boss_door_x": boss_door_x,
+        "boss_arena": boss_arena,
+        "reachability": reachability,
         "is_boss_level": is_boss_level,
         "boss_type": (level_num - 1) // 3 if is_boss_level else None,
     }
 
 
+def level_width_for(level_num):
+    return 50 + level_num * 10
+
+
+# Filled on demand by Game.level_data; Game.run generates the rest in the background after the first frame.
 LEVELS = {}
-for i in range(1, 11):
-    is_boss = (i % 3) == 0
-    width = 50 + i * 10
-    LEVELS[i] = generate_level(i, width, is_boss)
+LEVELS_LOCK = threading.Lock()
 
 
 class Particle:
@@ -1138,14 +1862,108 @@ class PowerUp:
             pygame.draw.rect(surface, BLACK, (draw_x + 10, draw_y + 6, 4, 12))
 
 
+class EntityIndex:
+    """Entities kept sorted by rect.x so the camera window can be bisected.
+    
+    Entities only move a few pixels per tick, so ``refresh`` re-sorts with
+    list.sort, which is linear on nearly sorted input.  Dead and collected
+    entities are dropped on refresh since they no longer draw.
+    """
+    
+    def __init__(self):
+        self.xs = []
+        self.entries = []
+        self.counter = 0
+    
+    def add(self, entity, layer=0):
+        x = entity.rect.x
+        pos = bisect.bisect_right(self.xs, x)
+        self.xs.insert(pos, x)
+        self.entries.insert(pos, (layer, self.counter, entity))
+        self.counter += 1
+    
+    def rebuild(self, layered_entities):
+        """Replace the contents with (layer, entity) pairs in one sort."""
+        self.entries = sorted(((layer, i, entity) for i, (layer, entity) in enumerate(layered_entities)),
+                              key=lambda entry: entry[2].rect.x)
+        self.xs = [entry[2].rect.x for entry in self.entries]
+        self.counter = len(self.entries)
+    
+    def refresh(self):
+        entries = [entry for entry in self.entries
+                   if getattr(entry[2], 'alive', True) and not getattr(entry[2], 'collected', False)]
+        entries.sort(key=lambda entry: entry[2].rect.x)
+        self.entries = entries
+        self.xs = [entry[2].rect.x for entry in entries]
+    
+    def window(self, left, right):
+        """Entities whose x lies in [left, right], in draw-layer order."""
+        lo = bisect.bisect_left(self.xs, left)
+        hi = bisect.bisect_right(self.xs, right)
+        return [entry[2] for entry in sorted(self.entries[lo:hi])]
+    
+    def drop_before(self, x):
+        keep = [i for i, entry in enumerate(self.entries) if entry[2].rect.right > x]
+        self.xs = [self.xs[i] for i in keep]
+        self.entries = [self.entries[i] for i in keep]
+    
+    def __len__(self):
+        return len(self.entries)
+
+
+class HazardIndex:
+    """Static hazards looked up by the tile columns a rect overlaps.
+    
+    Spike cells are read straight from the TileGrid.  Traps never move and
+    falling spikes only move vertically, so both are bucketed once by the
+    columns they cover and the player check only visits a couple of buckets.
+    """
+    
+    def __init__(self, grid):
+        self.grid = grid
+        self.traps = {}
+        self.falling_spikes = {}
+    
+    def add(self, bucket, entity):
+        for col in range(entity.rect.left // TILE_SIZE, (entity.rect.right - 1) // TILE_SIZE + 1):
+            bucket.setdefault(col, []).append(entity)
+    
+    def drop_before(self, x):
+        first_col = x // TILE_SIZE
+        for bucket in (self.traps, self.falling_spikes):
+            for col in [c for c in bucket if c < first_col]:
+                del bucket[col]
+    
+    def hit(self, rect):
+        """Death cause for the first hazard rect touches, or None."""
+        for col, row in self.grid.cells_overlapping(rect):
+            if self.grid.tile_at(col, row) in HAZARD_TILES:
+                return "spike"
+        cols = range(rect.left // TILE_SIZE, (rect.right - 1) // TILE_SIZE + 1)
+        for col in cols:
+            for trap in self.traps.get(col, ()):
+                if rect.colliderect(trap.rect):
+                    return "trap"
+        for col in cols:
+            for spike in self.falling_spikes.get(col, ()):
+                if spike.swept.colliderect(rect):
+                    return "falling_spike"
+        return None
+
+
 class Level:
-    def __init__(self, level_num):
+    DRAW_LAYERS = ("moving_platforms", "coins", "bats", "ghosts", "slimes", "teleporters",
+                   "thieves", "dodgers", "shielders", "healers", "traps", "falling_spikes",
+                   "powerups", "enemies")
+    # Layers whose entities make decisions through Level.think, in thinker order.
+    THINKER_LAYERS = ("thieves", "dodgers", "shielders", "healers")
+    
+    def __init__(self, level_num, data=None):
         self.level_num = level_num
-        self.data = LEVELS[level_num]
+        self.data = data if data is not None else LEVELS[level_num]
         self.name = self.data["name"]
         self.sky_color = self.data["sky_color"]
         
-        self.tiles = []
         self.coins = []
         self.enemies = []
         self.bats = []
@@ -1162,87 +1980,194 @@ class Level:
         self.powerups = []
         self.particles = []
         self.boss = None
+        self.spawn_x = 100
+        self.thinkers = []
+        self.ai_cursor = 0
         
         self.load_level()
     
     def load_level(self):
-        self.tile_rects = []
+        self.tile_layers = {}
+        self.obs_tile_layers = {}
+        self.entity_index = EntityIndex()
+        self.grid = TileGrid(self.data["map"])
+        self.hazards = HazardIndex(self.grid)
         
-        for row_idx, row in enumerate(self.data["map"]):
-            for col_idx, tile_type in enumerate(row):
-                if tile_type != TILE_EMPTY:
-                    tile = Tile(col_idx, row_idx, tile_type)
-                    self.tiles.append(tile)
-                    self.tile_rects.append(tile)
+        self.load_chunk(self.data)
+        
+        if self.data.get("is_boss_level") and self.data.get("boss_type") is not None:
+            self.boss = self.make_boss()
+    
+    @property
+    def tiles(self):
+        return list(self.grid.tiles())
+    
+    tile_rects = tiles
+    
+    def state(self):
+        """Mutable part of the level: entity lists, particles, boss, spawn point and AI cursor."""
+        return [getattr(self, name) for name in self.DRAW_LAYERS], self.particles, self.boss, self.spawn_x, self.ai_cursor
+    
+    def set_state(self, state):
+        entity_lists, self.particles, self.boss, self.spawn_x, self.ai_cursor = state
+        for name, entities in zip(self.DRAW_LAYERS, entity_lists):
+            setattr(self, name, entities)
+        self.reindex()
+    
+    def reindex(self):
+        """Rebuild the draw and hazard indexes from the entity lists."""
+        self.entity_index = EntityIndex()
+        self.entity_index.rebuild((layer, entity) for layer, name in enumerate(self.DRAW_LAYERS)
+                                  for entity in getattr(self, name))
+        self.hazards = HazardIndex(self.grid)
+        for name in ("traps", "falling_spikes"):
+            for entity in getattr(self, name):
+                self.hazards.add(getattr(self.hazards, name), entity)
+        self.thinkers = [entity for name in self.THINKER_LAYERS for entity in getattr(self, name)]
+    
+    def make_boss(self):
+        left, right = self.data.get("boss_arena", (100, 700))
+        return Boss((left + right) // 2 - 32, 10 * TILE_SIZE - 80, self.data.get("boss_type") or 0, (left, right))
+    
+    def spawn(self, name, entity):
+        getattr(self, name).append(entity)
+        self.entity_index.add(entity, self.DRAW_LAYERS.index(name))
+        if name in ("traps", "falling_spikes"):
+            self.hazards.add(getattr(self.hazards, name), entity)
+        elif name in self.THINKER_LAYERS:
+            # Keep self.thinkers the concatenation of the thinker layers, so a
+            # restored level (see reindex) thinks in the same order.
+            layers = self.THINKER_LAYERS[:self.THINKER_LAYERS.index(name) + 1]
+            at = sum(len(getattr(self, layer)) for layer in layers) - 1
+            self.thinkers.insert(at, entity)
+            if at < self.ai_cursor:
+                self.ai_cursor += 1
+    
+    def load_chunk(self, data, col_offset=0, rng=random):
+        """Create entities for generated level data starting at world column col_offset.
         
-        for x, y in self.data["coins"]:
-            self.coins.append(Coin(x * TILE_SIZE, y * TILE_SIZE))
+        Tiles live in self.grid; streamed chunks append their map columns there.
+        """
+        ox = col_offset * TILE_SIZE
         
-        for x, y, etype in self.data["enemies"]:
-            self.enemies.append(Enemy(x * TILE_SIZE, y * TILE_SIZE, etype))
+        for x, y in data["coins"]:
+            self.spawn("coins", Coin((x + col_offset) * TILE_SIZE, y * TILE_SIZE))
         
-        for x, y in self.data.get("bats", []):
-            self.bats.append(Bat(x, y))
+        for x, y, etype in data["enemies"]:
+            self.spawn("enemies", Enemy((x + col_offset) * TILE_SIZE, y * TILE_SIZE, etype))
         
-        for x, y in self.data.get("ghosts", []):
-            self.ghosts.append(Ghost(x, y))
+        for x, y in data.get("bats", []):
+            self.spawn("bats", Bat(x + ox, y))
         
-        for x, y in self.data.get("slimes", []):
-            self.slimes.append(Slime(x, y))
+        for x, y in data.get("ghosts", []):
+            self.spawn("ghosts", Ghost(x + ox, y))
         
-        for x, y in self.data.get("teleporters", []):
-            self.teleporters.append(Teleporter(x, y))
+        for x, y in data.get("slimes", []):
+            self.spawn("slimes", Slime(x + ox, y))
         
-        for x, y in self.data.get("thieves", []):
-            self.thieves.append(Thief(x, y))
+        for x, y in data.get("teleporters", []):
+            self.spawn("teleporters", Teleporter(x + ox, y))
         
-        for x, y in self.data.get("dodgers", []):
-            self.dodgers.append(Dodger(x, y))
+        for x, y in data.get("thieves", []):
+            self.spawn("thieves", Thief(x + ox, y))
         
-        for x, y in self.data.get("shielders", []):
-            self.shielders.append(Shielder(x, y))
+        for x, y in data.get("dodgers", []):
+            self.spawn("dodgers", Dodger(x + ox, y))
         
-        for x, y in self.data.get("healers", []):
-            self.healers.append(Healer(x, y))
+        for x, y in data.get("shielders", []):
+            self.spawn("shielders", Shielder(x + ox, y))
         
-        for x, y, w in self.data.get("moving_platforms", []):
-            self.moving_platforms.append(MovingPlatform(x, y, w))
+        for x, y in data.get("healers", []):
+            self.spawn("healers", Healer(x + ox, y))
         
-        for x, y, ttype in self.data.get("traps", []):
-            self.traps.append(SpikeTrap(x, y, ttype))
+        for x, y, w in data.get("moving_platforms", []):
+            self.spawn("moving_platforms", MovingPlatform(x + col_offset, y, w))
         
-        for x, y in self.data.get("falling_spikes", []):
-            self.falling_spikes.append(FallingSpike(x, y))
+        for x, y, ttype in data.get("traps", []):
+            self.spawn("traps", SpikeTrap(x + ox, y, ttype))
         
-        for _ in range(2 + self.level_num // 2):
-            x = random.randint(10, len(self.data["map"][0]) - 10) * TILE_SIZE
-            y = random.randint(3, 10) * TILE_SIZE
-            self.powerups.append(PowerUp(x, y, random.randint(0, 2)))
+        for x, y in data.get("falling_spikes", []):
+            self.spawn("falling_spikes", FallingSpike(x + ox, y))
         
-        if self.data.get("is_boss_level") and self.data.get("boss_type") is not None:
-            self.boss = Boss(500, 10 * TILE_SIZE - 80, self.data["boss_type"])
+        for _ in range(2 + self.level_num // 2):
+            x = (rng.randint(10, len(data["map"][0]) - 10) + col_offset) * TILE_SIZE
+            y = rng.randint(3, 10) * TILE_SIZE
+            self.spawn("powerups", PowerUp(x, y, rng.randint(0, 2)))
+    
+    def evict_before(self, x):
+        """Drop tiles, entities and cached tile layers that lie entirely left of x."""
+        for name in self.DRAW_LAYERS:
+            setattr(self, name, [e for e in getattr(self, name) if e.rect.right > x])
+        self.ai_cursor -= sum(e.rect.right <= x for e in self.thinkers[:self.ai_cursor])
+        self.thinkers = [e for e in self.thinkers if e.rect.right > x]
+        self.particles = [p for p in self.particles if p.x > x]
+        self.entity_index.drop_before(x)
+        self.hazards.drop_before(x)
+        for chunk in [c for c in self.tile_layers if (c + 1) * RENDER_CHUNK_COLS * TILE_SIZE <= x]:
+            del self.tile_layers[chunk]
+        for key in [k for k in self.obs_tile_layers if (k[0] + 1) * RENDER_CHUNK_COLS * TILE_SIZE <= x]:
+            del self.obs_tile_layers[key]
+        self.grid.evict_columns(x // TILE_SIZE - self.grid.col_offset)
     
-    def update(self, player_rect=None):
+    def tile_layer(self, chunk):
+        """Pre-rendered surface holding the static tiles of one render chunk.
+        
+        Tiles are drawn without antialiasing, so the empty cells are keyed
+        out with an RLE colour key instead of per-pixel alpha, which blits
+        many times faster.
+        """
+        layer = self.tile_layers.get(chunk)
+        if layer is None:
+            layer = pygame.Surface((RENDER_CHUNK_COLS * TILE_SIZE, self.grid.rows * TILE_SIZE))
+            layer.fill(TILE_LAYER_KEY)
+            first_col = chunk * RENDER_CHUNK_COLS
+            for col in range(first_col, first_col + RENDER_CHUNK_COLS):
+                for row in range(self.grid.rows):
+                    tile_type = self.grid.tile_at(col, row)
+                    if tile_type != TILE_EMPTY:
+                        draw_tile(layer, tile_type, (col - first_col) * TILE_SIZE, row * TILE_SIZE)
+            layer.set_colorkey(TILE_LAYER_KEY, pygame.RLEACCEL)
+            self.tile_layers[chunk] = layer
+        return layer
+    
+    def obs_tile_layer(self, chunk, size):
+        """The chunk's tile layer shrunk to size on an 8-bit OBS_PALETTE surface, colour 0 see-through."""
+        layer = self.obs_tile_layers.get((chunk, size))
+        if layer is None:
+            cached = chunk in self.tile_layers
+            rgb = pygame.Surface(size)
+            rgb.fill(OBS_PALETTE[0])
+            rgb.blit(pygame.transform.smoothscale(self.tile_layer(chunk), size), (0, 0))
+            if not cached:
+                del self.tile_layers[chunk]
+            layer = pygame.Surface(size, depth=8)
+            layer.set_palette(OBS_PALETTE)
+            layer.blit(rgb, (0, 0))
+            layer.set_colorkey(0)
+            self.obs_tile_layers[(chunk, size)] = layer
+        return layer
+    
+    def update(self, player_rect=None, bullets=()):
         for coin in self.coins:
             coin.update()
         for enemy in self.enemies:
-            enemy.update(self.tile_rects)
+            enemy.update(self.grid)
         for bat in self.bats:
             bat.update()
         for ghost in self.ghosts:
             ghost.update(player_rect)
         for slime in self.slimes:
-            slime.update(self.tile_rects)
+            slime.update(self.grid)
         for teleporter in self.teleporters:
-            teleporter.update(player_rect, self.tile_rects)
+            teleporter.update(player_rect, self.grid)
         for thief in self.thieves:
-            thief.update(player_rect, self.coins)
+            thief.update(player_rect)
         for dodger in self.dodgers:
-            dodger.update(player_rect, [])
+            dodger.update()
         for shielder in self.shielders:
-            shielder.update(self.enemies, player_rect)
+            shielder.update()
         for healer in self.healers:
-            healer.update(self.enemies)
+            healer.update()
         for platform in self.moving_platforms:
             platform.update()
         for trap in self.traps:
@@ -1256,172 +2181,899 @@ class Level:
             if particle.lifetime <= 0:
                 self.particles.remove(particle)
         if self.boss and self.boss.alive:
-            self.boss.update(self.tile_rects[0].rect if self.tile_rects else None, self.tile_rects)
+            self.boss.update(player_rect, self.grid)
+        self.think(player_rect, bullets)
+        self.entity_index.refresh()
+    
+    def think(self, player_rect, bullets=()):
+        """Run the next few AI decisions, round-robin over self.thinkers.
+        
+        Movement and timers above run every tick; decisions are capped at
+        AI_THINKS_PER_TICK per tick, and at AI_BUDGET_MS of wall time when a
+        budget is set, so their cost stays flat however many specialised
+        hostiles a level has.  The cursor is the index of the next thinker;
+        spawn and evict_before shift it so it keeps pointing at the same
+        one, and it is part of the level state so restored games make the
+        same decisions again.
+        """
+        thinkers = self.thinkers
+        count = len(thinkers)
+        if not count:
+            return
+        deadline = time.perf_counter() + AI_BUDGET_MS / 1000 if AI_BUDGET_MS else None
+        for _ in range(min(AI_THINKS_PER_TICK, count)):
+            if self.ai_cursor >= count:
+                self.ai_cursor = 0
+            entity = thinkers[self.ai_cursor]
+            self.ai_cursor += 1
+            if entity.alive:
+                entity.think(self, player_rect, bullets)
+                if deadline is not None and time.perf_counter() >= deadline:
+                    break
+    
+    def visible_chunks(self, camera_x):
+        """(screen x, tile layer) for each render chunk in view; layers far off screen are dropped."""
+        chunk_width = RENDER_CHUNK_COLS * TILE_SIZE
+        first_chunk = max(self.grid.left, int(camera_x)) // chunk_width
+        last_chunk = min(self.grid.right - 1, int(camera_x) + SCREEN_WIDTH) // chunk_width
+        chunks = [(chunk * chunk_width - camera_x, self.tile_layer(chunk)) for chunk in range(first_chunk, last_chunk + 1)]
+        for chunk in [c for c in self.tile_layers if c < first_chunk - 1 or c > last_chunk + 1]:
+            del self.tile_layers[chunk]
+        return chunks
+    
+    def visible_entities(self, camera_x):
+        """Entities near the view in draw order, then the boss and particles."""
+        entities = self.entity_index.window(camera_x - DRAW_MARGIN, camera_x + SCREEN_WIDTH + DRAW_MARGIN)
+        if self.boss:
+            entities.append(self.boss)
+        entities.extend(self.particles)
+        return entities
     
     def draw(self, surface, camera_x):
-        for tile in self.tiles:
-            tile.draw(surface, camera_x)
-        
-        for platform in self.moving_platforms:
-            platform.draw(surface, camera_x)
-        
-        for coin in self.coins:
-            coin.draw(surface, camera_x)
-        
-        for bat in self.bats:
-            bat.draw(surface, camera_x)
-        
-        for ghost in self.ghosts:
-            ghost.draw(surface, camera_x)
-        
-        for slime in self.slimes:
-            slime.draw(surface, camera_x)
-        
-        for teleporter in self.teleporters:
-            teleporter.draw(surface, camera_x)
-        
-        for thief in self.thieves:
-            thief.draw(surface, camera_x)
-        
-        for dodger in self.dodgers:
-            dodger.draw(surface, camera_x)
-        
-        for shielder in self.shielders:
-            shielder.draw(surface, camera_x)
-        
-        for healer in self.healers:
-            healer.draw(surface, camera_x)
-        
-        for trap in self.traps:
-            trap.draw(surface, camera_x)
-        
-        for spike in self.falling_spikes:
-            spike.draw(surface, camera_x)
-        
-        for powerup in self.powerups:
-            powerup.draw(surface, camera_x)
-        
-        for enemy in self.enemies:
-            enemy.draw(surface, camera_x)
-        
-        if self.boss:
-            self.boss.draw(surface, camera_x)
-        
-        for particle in self.particles:
-            particle.draw(surface, camera_x)
+        for x, layer in self.visible_chunks(camera_x):
+            surface.blit(layer, (x, 0))
+        for entity in self.visible_entities(camera_x):
+            entity.draw(surface, camera_x)
 
 
-class MusicPlayer:
-    def __init__(self):
-        try:
-            pygame.mixer.init(frequency=44100, size=-16, channels=2, buffer=512)
-            self.available = True
-        except:
-            self.available = False
+class EndlessLevel(Level):
+    """Endless runner level streamed in fixed-width chunks from a seed.
     
-    def _generate_tone(self, freq, duration, volume=0.3):
-        sample_rate = 44100
-        n_samples = int(sample_rate * duration)
-        waveform = array.array('h', [0] * n_samples)
-        for i in range(n_samples):
-            t = i / sample_rate
-            envelope = min(1.0, (n_samples - i) / (sample_rate * 0.02))
-            sample = int(envelope * volume * 32767 * 0.5)
-            waveform[i] = sample if i % 2 == 0 else -sample
-        return pygame.sndarray.make_sound(waveform)
+    Each chunk is generated by ``generate_level`` with its own RNG derived
+    from the seed and chunk index, so the world is reproducible no matter how
+    far ahead it is streamed.  Chunks behind the player are evicted, keeping
+    memory and per-tick work bounded by the loaded window.
+    """
     
-    def play_jump(self):
-        if not self.available:
-            return
+    def __init__(self, seed):
+        self.seed = seed
+        self.next_chunk = 0
+        data = {
+            "name": "Endless",
+            "sky_color": SKY_BLUE,
+            "map": [[] for _ in range(18)],
+            "boss_door_x": None,
+            "is_boss_level": False,
+            "boss_type": None,
+        }
+        super().__init__(1, data)
+    
+    def load_level(self):
+        self.tile_layers = {}
+        self.obs_tile_layers = {}
+        self.entity_index = EntityIndex()
+        self.grid = TileGrid(self.data["map"])
+        self.hazards = HazardIndex(self.grid)
+        self.stream(0)
+    
+    def append_chunk(self):
+        index = self.next_chunk
+        rng = random.Random(self.seed * 1000003 + index)
+        difficulty = min(10, 1 + index // 8)
+        chunk = generate_level(difficulty, ENDLESS_CHUNK_COLS, False, rng)
+        col_offset = index * ENDLESS_CHUNK_COLS
+        self.grid.append_columns(chunk["map"])
+        self.load_chunk(chunk, col_offset, rng)
+        self.next_chunk += 1
+    
+    def state(self):
+        return super().state() + (self.grid.map, self.grid.col_offset, self.next_chunk)
+    
+    def set_state(self, state):
+        # Chunk contents only depend on the seed, so cached tile layers stay valid.
+        self.grid.map, self.grid.col_offset, self.next_chunk = state[5:]
+        self.grid.cols = len(self.grid.map[0])
+        super().set_state(state[:5])
+    
+    def stream(self, player_x):
+        while self.grid.right < player_x + ENDLESS_LOOKAHEAD:
+            self.append_chunk()
+        evict_x = self.grid.left + ENDLESS_CHUNK_COLS * TILE_SIZE
+        while evict_x <= player_x - ENDLESS_KEEP_BEHIND:
+            self.evict_before(evict_x)
+            self.spawn_x = self.grid.left + 100
+            evict_x += ENDLESS_CHUNK_COLS * TILE_SIZE
+
+
+# Effect name -> (tone frequencies played in turn, seconds per tone, volume, ms between tone starts, voice category).
+SOUND_EFFECTS = {
+    "jump": ([250, 350, 450], 0.06, 0.25, 40, "player"),
+    "coin": ([523, 659, 784], 0.08, 0.25, 60, "pickup"),
+    "shoot": ([800], 0.05, 0.2, 0, "player"),
+    "hit": ([150], 0.15, 0.4, 0, "combat"),
+    "boss_hit": ([400, 300, 200], 0.1, 0.3, 80, "boss"),
+    "death": ([400, 350, 300, 250, 200, 150], 0.12, 0.3, 80, "event"),
+    "win": ([523, 659, 784, 1047, 784, 659, 523, 659, 784, 1047], 0.18, 0.25, 140, "event"),
+}
+# Voice category -> mixer channels reserved for it; together they cap concurrent effect voices.
+VOICE_CHANNELS = {"player": 2, "pickup": 2, "combat": 3, "boss": 2, "event": 1}
+# The background track gets the reserved channel after the effect voices.
+MUSIC_CHANNEL = sum(VOICE_CHANNELS.values())
+MUSIC_BUFFER_BEATS = 3
+MAJOR_SCALE = (0, 2, 4, 5, 7, 9, 11)
+MINOR_SCALE = (0, 2, 3, 5, 7, 8, 10)
+CHORD_PROGRESSIONS = ((0, 4, 5, 3), (0, 5, 3, 4), (0, 3, 4, 4), (5, 3, 0, 4))
+
+
+def synth_tone(freq, duration, volume, rate, channels):
+    """Signed 16-bit PCM of a square wave with a 20 ms fade-out, interleaved for channels."""
+    n_samples = int(rate * duration)
+    fade = rate * 0.02
+    half_period = rate / (2 * freq)
+    peak = volume * 32767 * 0.5
+    samples = array.array("h")
+    # Before the fade the level is constant, so whole half periods are written as runs.
+    steady = min(n_samples, max(0, math.floor(n_samples - fade) + 1))
+    i = 0
+    while i < steady:
+        half = int(i / half_period)
+        end = min(steady, math.ceil((half + 1) * half_period))
+        while end < steady and int(end / half_period) == half:
+            end += 1
+        while end - 1 > i and int((end - 1) / half_period) != half:
+            end -= 1
+        samples.extend([int(peak) if half % 2 == 0 else -int(peak)] * ((end - i) * channels))
+        i = end
+    for i in range(steady, n_samples):
+        sample = int(min(1.0, (n_samples - i) / fade) * peak)
+        samples.extend([sample if int(i / half_period) % 2 == 0 else -sample] * channels)
+    return samples.tobytes()
+
+
+def mix_pcm(parts, length=None):
+    """Sum (start sample, PCM) parts into one 16-bit clip with clipping, cut or padded to length samples."""
+    mix = []
+    for start, pcm in parts:
+        clip = array.array("h", pcm)
+        end = start + len(clip)
+        mix.extend([0] * (end - len(mix)))
+        mix[start:end] = [a + b for a, b in zip(mix[start:end], clip)]
+    if length is not None:
+        mix = mix[:length] + [0] * (length - len(mix))
+    if mix and (max(mix) > 32767 or min(mix) < -32768):
+        mix = [max(-32768, min(32767, sample)) for sample in mix]
+    return array.array("h", mix).tobytes()
+
+
+def synth_effect(freqs, duration, volume, gap, rate, channels):
+    """One PCM clip of an effect's tones, each starting gap ms after the last."""
+    step = int(rate * gap / 1000) * channels
+    return mix_pcm((index * step, synth_tone(freq, duration, volume, rate, channels))
+                   for index, freq in enumerate(freqs))
+
+
+class SoundBank:
+    """Every effect in SOUND_EFFECTS as one Sound in the open mixer's format.
+    
+    warm() loads the PCM for all effects with one read of a cache file in
+    SOUND_CACHE_DIR, keyed by the effect table and mixer format, and only
+    synthesizes (then writes that file) when it is missing or stale.
+    """
+    
+    MAGIC = b"SMSB"
+    
+    def __init__(self, cache_dir=SOUND_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.sounds = {}
+    
+    def cache_path(self, mixer_format):
+        key = zlib.crc32(repr((SOUND_BANK_VERSION, mixer_format, sys.byteorder, sorted(SOUND_EFFECTS.items()))).encode())
+        return os.path.join(self.cache_dir, f"sounds-{key:08x}.pcm")
+    
+    def read(self, path):
+        """PCM chunks for the effects in name order from a cache file, or None if it is missing or unreadable."""
         try:
-            for freq in [250, 350, 450]:
-                sound = self._generate_tone(freq, 0.06, 0.25)
-                pygame.mixer.Sound.play(sound)
-                pygame.time.wait(40)
-        except:
-            pass
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        if len(data) < 8 or data[:4] != self.MAGIC:
+            return None
+        try:
+            index_size, = struct.unpack_from("!I", data, 4)
+            lengths = json.loads(data[8:8 + index_size])
+        except (struct.error, ValueError):
+            return None
+        if (not isinstance(lengths, list) or len(lengths) != len(SOUND_EFFECTS)
+                or not all(isinstance(length, int) and length >= 0 for length in lengths)
+                or 8 + index_size + sum(lengths) != len(data)):
+            return None
+        view = memoryview(data)
+        chunks, offset = [], 8 + index_size
+        for length in lengths:
+            chunks.append(view[offset:offset + length])
+            offset += length
+        return chunks
     
-    def play_coin(self):
-        if not self.available:
-            return
+    def write(self, path, chunks):
+        index = json.dumps([len(chunk) for chunk in chunks]).encode()
         try:
-            for freq in [523, 659, 784]:
-                sound = self._generate_tone(freq, 0.08, 0.25)
-                pygame.mixer.Sound.play(sound)
-                pygame.time.wait(60)
-        except:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(path + ".tmp", "wb") as f:
+                f.write(self.MAGIC + struct.pack("!I", len(index)) + index + b"".join(chunks))
+            os.replace(path + ".tmp", path)
+        except OSError:
             pass
     
-    def play_shoot(self):
-        if not self.available:
-            return
+    def warm(self):
+        trace_begin("audio.warm")
+        rate, size, channels = mixer_format = pygame.mixer.get_init()
+        path = self.cache_path(mixer_format)
+        names = sorted(SOUND_EFFECTS)
+        chunks = self.read(path)
+        if chunks is None:
+            chunks = [synth_effect(*SOUND_EFFECTS[name][:4], rate, channels) for name in names]
+            self.write(path, chunks)
+        self.sounds = {name: pygame.mixer.Sound(buffer=chunk) for name, chunk in zip(names, chunks)}
+        if MEMORY is not None:
+            MEMORY.sounds.update(self.sounds.values())
+        trace_end()
+
+
+class VoiceManager:
+    """Plays bank effects on mixer channels reserved per VOICE_CHANNELS category.
+    
+    request() only notes an effect; flush(), once a frame, starts each
+    distinct effect requested since the last flush once, so a burst of
+    kills in one tick is one hit sound.  A category with no idle channel
+    restarts its own oldest voice, so busy categories never take channels
+    from others (the boss's, say) and the effect voice count stays capped.
+    """
+    
+    def __init__(self, sounds):
+        self.sounds = sounds
+        self.pending = {}
+        self.channels = {}
+        first = 0
+        for category, size in VOICE_CHANNELS.items():
+            self.channels[category] = [pygame.mixer.Channel(first + i) for i in range(size)]
+            first += size
+    
+    def request(self, effect):
+        self.pending[effect] = True
+    
+    def flush(self):
+        for effect in self.pending:
+            # Each list is kept oldest-started first.
+            channels = self.channels[SOUND_EFFECTS[effect][4]]
+            channel = next((channel for channel in channels if not channel.get_busy()), channels[0])
+            channels.remove(channel)
+            channels.append(channel)
+            channel.play(self.sounds[effect])
+        self.pending.clear()
+
+
+class MusicStream:
+    """Endless procedural track for one level, synthesized a beat at a time on a worker thread.
+    
+    The worker composes from its own Random seeded by the level, so the
+    simulation's random state is untouched, and blocks once
+    MUSIC_BUFFER_BEATS beats are waiting.  pump(), called every frame,
+    moves the next beat into the channel's one-slot queue without waiting,
+    so the game loop never pays for synthesis and memory stays at a few
+    beats however long the track plays.
+    """
+    
+    def __init__(self, channel, level_num, boss):
+        self.channel = channel
+        self.beats = queue.Queue(maxsize=MUSIC_BUFFER_BEATS)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.compose, args=(level_num, boss, pygame.mixer.get_init()),
+                                       name="music", daemon=True)
+        self.thread.start()
+    
+    def compose(self, level_num, boss, mixer_format):
+        rate, _, channels = mixer_format
+        rng = random.Random(level_num * 2 + boss)
+        scale = MINOR_SCALE if boss else MAJOR_SCALE
+        beat = 0.36 if boss else 0.5
+        bass_root = 110 * 2 ** ((level_num * 5 % 12) / 12)
+        progression = rng.choice(CHORD_PROGRESSIONS)
+        
+        def pitch(degree, octave_root):
+            return octave_root * 2 ** ((scale[degree % 7] + 12 * (degree // 7)) / 12)
+        
+        beat_samples = int(rate * beat) * channels
+        half_beat = beat_samples // 2 // channels * channels
         try:
-            sound = self._generate_tone(800, 0.05, 0.2)
-            pygame.mixer.Sound.play(sound)
-        except:
+            while not self.stopped.is_set():
+                for chord in progression:
+                    parts = [(0, synth_tone(pitch(chord, bass_root), beat * 0.9, 0.12, rate, channels))]
+                    for start in (0, half_beat):
+                        if rng.random() > 0.15:
+                            degree = chord + rng.choice((0, 2, 4, 7))
+                            parts.append((start, synth_tone(pitch(degree, bass_root * 4), beat / 2, 0.1, rate, channels)))
+                    sound = pygame.mixer.Sound(buffer=mix_pcm(parts, beat_samples))
+                    while not self.stopped.is_set():
+                        try:
+                            self.beats.put(sound, timeout=0.1)
+                            break
+                        except queue.Full:
+                            pass
+        except pygame.error:
             pass
     
-    def play_hit(self):
-        if not self.available:
+    def pump(self):
+        if self.channel.get_queue() is not None:
             return
         try:
-            sound = self._generate_tone(150, 0.15, 0.4)
-            pygame.mixer.Sound.play(sound)
-        except:
-            pass
+            sound = self.beats.get_nowait()
+        except queue.Empty:
+            return
+        if self.channel.get_busy():
+            self.channel.queue(sound)
+        else:
+            self.channel.play(sound)
     
-    def play_boss_hit(self):
-        if not self.available:
+    def stop(self):
+        self.stopped.set()
+        self.channel.stop()
+
+
+class MusicPlayer:
+    def __init__(self, enabled=True, deferred=False):
+        """deferred leaves the mixer closed, and sounds silent, until start() is called."""
+        self.enabled = enabled
+        self.available = False
+        self.bank = SoundBank()
+        self.voices = None
+        self.track = None
+        self.stream = None
+        if not deferred:
+            self.start()
+    
+    def start(self):
+        if not self.enabled:
             return
         try:
-            for freq in [400, 300, 200]:
-                sound = self._generate_tone(freq, 0.1, 0.3)
-                pygame.mixer.Sound.play(sound)
-                pygame.time.wait(80)
+            pygame.mixer.init(frequency=44100, size=-16, channels=2, buffer=512)
+            # Only 16-bit mixers match the bank's PCM; anything else stays silent.
+            if pygame.mixer.get_init()[1] in (16, -16):
+                self.bank.warm()
+                pygame.mixer.set_num_channels(max(MUSIC_CHANNEL + 1, pygame.mixer.get_num_channels()))
+                pygame.mixer.set_reserved(MUSIC_CHANNEL + 1)
+                self.voices = VoiceManager(self.bank.sounds)
+                self.music_channel = pygame.mixer.Channel(MUSIC_CHANNEL)
+                self.available = True
         except:
-            pass
+            self.available = False
     
-    def play_death(self):
+    def play(self, effect):
+        """Queue an effect for the next flush()."""
+        if self.available:
+            self.voices.request(effect)
+    
+    def flush(self, track=None):
+        """Start the effects queued this frame and keep `track` streaming; called once per frame after the update.
+        
+        track is a (level number, boss) pair from Game.music_track, or None for silence.
+        """
         if not self.available:
             return
+        trace_begin("audio.flush")
         try:
-            for freq in [400, 350, 300, 250, 200, 150]:
-                sound = self._generate_tone(freq, 0.12, 0.3)
-                pygame.mixer.Sound.play(sound)
-                pygame.time.wait(80)
+            self.voices.flush()
+            if track != self.track:
+                if self.stream is not None:
+                    self.stream.stop()
+                self.stream = MusicStream(self.music_channel, *track) if track else None
+                self.track = track
+            if self.stream is not None:
+                self.stream.pump()
         except:
             pass
+        trace_end()
+    
+    def play_jump(self):
+        self.play("jump")
+    
+    def play_coin(self):
+        self.play("coin")
+    
+    def play_shoot(self):
+        self.play("shoot")
+    
+    def play_hit(self):
+        self.play("hit")
+    
+    def play_boss_hit(self):
+        self.play("boss_hit")
+    
+    def play_death(self):
+        self.play("death")
     
     def play_win(self):
-        if not self.available:
+        self.play("win")
+
+
+class KeyState:
+    """Stand-in for pygame.key.get_pressed() built from a set of key codes."""
+    
+    def __init__(self, pressed=()):
+        self.pressed = frozenset(pressed)
+    
+    def __getitem__(self, key):
+        return key in self.pressed
+
+
+class RewindBuffer:
+    """Fixed-size ring buffer of recent game states for hold-to-rewind.
+    
+    States come from Game.state_parts as a list of separately pickled parts.
+    Every ``keyframe_interval`` ticks the full list is kept as a keyframe;
+    other ticks store only the parts that differ from the latest keyframe,
+    zlib-compressed with the keyframe as preset dictionary so entities that
+    did not change inside a stored part shrink to back-references.  Frames
+    older than ``capacity`` ticks fall off the end of the deque.
+    """
+    
+    def __init__(self, capacity=REWIND_TICKS, keyframe_interval=REWIND_KEYFRAME_INTERVAL):
+        self.frames = deque(maxlen=capacity)
+        self.keyframe_interval = keyframe_interval
+        self.keyframe = None
+        self.since_keyframe = 0
+    
+    def record(self, parts):
+        if self.keyframe is None or self.since_keyframe >= self.keyframe_interval:
+            self.keyframe = (parts, b"".join(parts)[-32768:])
+            self.since_keyframe = 0
+            self.frames.append((self.keyframe, None))
+        else:
+            changed = {i: part for i, (part, key) in enumerate(zip(parts, self.keyframe[0])) if part != key}
+            compressor = zlib.compressobj(zdict=self.keyframe[1])
+            delta = compressor.compress(pickle.dumps(changed, pickle.HIGHEST_PROTOCOL)) + compressor.flush()
+            self.frames.append((self.keyframe, delta))
+        self.since_keyframe += 1
+    
+    def pop(self):
+        """Parts of the most recently recorded state, removing it, or None when empty."""
+        if not self.frames:
+            return None
+        (key_parts, zdict), delta = self.frames.pop()
+        if self.frames and self.frames[-1][0][0] is key_parts:
+            self.since_keyframe -= 1
+        else:
+            self.keyframe = self.frames[-1][0] if self.frames else None
+            self.since_keyframe = self.keyframe_interval
+        if delta is None:
+            return key_parts
+        changed = pickle.loads(zlib.decompressobj(zdict=zdict).decompress(delta))
+        return [changed.get(i, part) for i, part in enumerate(key_parts)]
+    
+    def clear(self):
+        self.frames.clear()
+        self.keyframe = None
+    
+    def nbytes(self):
+        """Approximate memory held by recorded keyframes and deltas."""
+        keyframes = {id(key): sum(map(len, key[0])) + len(key[1]) for key, _ in self.frames}
+        return sum(keyframes.values()) + sum(len(delta) for _, delta in self.frames if delta)
+
+
+def frozen_copy(entity):
+    """Copy of an entity for drawing that later updates cannot change.
+    
+    Rects and lists are copied as well, and entities inside those lists
+    (bullets, boss attacks) are frozen in turn.
+    """
+    clone = copy.copy(entity)
+    for name, value in vars(clone).items():
+        if isinstance(value, pygame.Rect):
+            setattr(clone, name, value.copy())
+        elif isinstance(value, list):
+            setattr(clone, name, [frozen_copy(item) if hasattr(item, "draw") else item for item in value])
+    return clone
+
+
+class RenderView:
+    """Everything Game.draw reads from one tick.
+    
+    By default it references the live player and entities.  With
+    frozen=True they are copied, so the simulation can move on to the next
+    tick while this one is drawn on another thread.  Tile layers are never
+    changed once built and are shared either way.
+    """
+    
+    def __init__(self, game, frozen=False):
+        level = game.level
+        player = game.player
+        self.camera_x = game.camera_x
+        if QUALITY["shake"] and game.shake_x:
+            self.camera_x = max(level.grid.left, min(game.camera_x + game.shake_x, level.grid.right - SCREEN_WIDTH))
+        self.sky_color = level.sky_color
+        self.chunks = level.visible_chunks(self.camera_x)
+        self.entities = level.visible_entities(self.camera_x)
+        self.player = player
+        if frozen:
+            self.entities = [frozen_copy(entity) for entity in self.entities]
+            self.player = frozen_copy(player)
+        self.score = player.score
+        self.lives = player.lives
+        self.current_level = game.current_level
+        self.level_name = level.name
+        self.state = game.state
+        self.boss_name = level.boss.name if level.boss else None
+        self.combo_count = game.combo_count
+        self.invincible_timer = game.invincible_timer
+        self.rapid_fire_timer = game.rapid_fire_timer
+        self.chat_active = game.chat_active
+        self.chat_text = game.chat_text
+        self.chat_history = list(game.chat_history)
+
+
+class QualityGovernor:
+    """Steps cosmetic quality down when frames run over budget and back up with headroom.
+    
+    record() takes the work time of each frame, without the frame limiter's
+    sleep.  Every `window` frames the mean is compared to the budget: over
+    90% of it drops to the next QUALITY_TIERS tier, under `headroom` of it
+    climbs back one tier.  The gap between the two keeps it from flapping.
+    """
+    
+    def __init__(self, budget_ms=1000 / FPS, window=30, headroom=0.5):
+        self.budget_ms = budget_ms
+        self.window = window
+        self.headroom = headroom
+        self.samples = []
+        self.tier = 0
+        set_quality_tier(0)
+    
+    def record(self, frame_ms):
+        self.samples.append(frame_ms)
+        if len(self.samples) < self.window:
             return
-        try:
-            notes = [523, 659, 784, 1047, 784, 659, 523, 659, 784, 1047]
-            for freq in notes:
-                sound = self._generate_tone(freq, 0.18, 0.25)
-                pygame.mixer.Sound.play(sound)
-                pygame.time.wait(140)
-        except:
-            pass
+        mean = sum(self.samples) / len(self.samples)
+        self.samples.clear()
+        if mean > self.budget_ms * 0.9 and self.tier < len(QUALITY_TIERS) - 1:
+            self.tier += 1
+        elif mean < self.budget_ms * self.headroom and self.tier > 0:
+            self.tier -= 1
+        else:
+            return
+        set_quality_tier(self.tier)
+
+
+def qualified_names():
+    """Map pstats function keys of this module's functions and methods to names like Level.update."""
+    names = {}
+    for value in list(globals().values()):
+        members = vars(value).values() if isinstance(value, type) else [value]
+        for member in members:
+            if isinstance(member, property):
+                member = member.fget
+            code = getattr(member, "__code__", None)
+            if code is not None and code.co_filename == __file__:
+                names[(code.co_filename, code.co_firstlineno, code.co_name)] = member.__qualname__
+    return names
+
+
+def profile_summary(stats, limit=25):
+    """Top functions by own time, then own time per class, as text."""
+    names = qualified_names()
+    rows = []
+    for key, (_, calls, own, cumulative, _) in stats.stats.items():
+        filename, line, function = key
+        if key in names:
+            name = names[key]
+        elif filename == "~":
+            name = function
+        else:
+            name = f"{os.path.basename(filename)}:{line}({function})"
+        rows.append((own, cumulative, calls, name))
+    rows.sort(reverse=True)
+    
+    lines = [f"{stats.total_tt * 1000:.1f} ms profiled", "", "   own ms    cum ms    calls  function"]
+    for own, cumulative, calls, name in rows[:limit]:
+        lines.append(f"{own * 1000:9.1f} {cumulative * 1000:9.1f} {calls:8d}  {name}")
+    
+    groups = {}
+    for own, _, _, name in rows:
+        if "." in name and name.split(".")[0] in globals():
+            group = name.split(".")[0]
+        elif name in globals():
+            group = "(module functions)"
+        elif name.startswith("<"):
+            group = "(builtins and pygame)"
+        else:
+            group = "(other modules)"
+        groups[group] = groups.get(group, 0) + own
+    lines += ["", "   own ms  class"]
+    for group, own in sorted(groups.items(), key=lambda item: -item[1]):
+        lines.append(f"{own * 1000:9.1f}  {group}")
+    return "\n".join(lines)
+
+
+class FrameProfiler:
+    """cProfile capture of the next few frames of Game.run.
+    
+    start() arms a capture of `frames` frames (F12 in game, or
+    --profile-frames at launch) that begins at the next frame boundary,
+    frame_done() or begin().  Each thread that runs frame work profiles
+    into its own cProfile.Profile via profile(); when the last frame is
+    done the profiles are merged into profile-<time>.pstats plus a .txt
+    summary grouped by class, which is also printed.
+    
+    From Python 3.12 cProfile sits on sys.monitoring, which allows one
+    active profiler and sees every thread, so there a single profiler runs
+    for the whole capture and profile() returns None.
+    """
+    
+    SHARED = sys.version_info >= (3, 12)
+    
+    def __init__(self, frames=PROFILE_FRAMES):
+        self.frames = frames
+        self.captured = 0
+        self.remaining = 0
+        self.armed = 0
+        self.profiles = {}
+    
+    def start(self, frames=None):
+        if not self.remaining:
+            self.armed = frames or self.frames
+    
+    def begin(self):
+        """Start an armed capture now, at a frame boundary."""
+        if not self.armed or self.remaining:
+            return
+        self.captured = self.remaining = self.armed
+        self.armed = 0
+        self.profiles = {}
+        if self.SHARED:
+            self.profiles[0] = cProfile.Profile()
+            self.profiles[0].enable()
+    
+    def profile(self):
+        """The calling thread's profiler while a capture is running, else None."""
+        if not self.remaining or self.SHARED:
+            return None
+        return self.profiles.setdefault(threading.get_ident(), cProfile.Profile())
+    
+    def frame_done(self):
+        if not self.remaining:
+            self.begin()
+            return
+        self.remaining -= 1
+        if not self.remaining:
+            self.save()
+    
+    def save(self):
+        if self.SHARED:
+            self.profiles[0].disable()
+        stem = time.strftime("profile-%Y%m%d-%H%M%S")
+        stats = pstats.Stats(*self.profiles.values())
+        stats.dump_stats(stem + ".pstats")
+        summary = profile_summary(stats)
+        with open(stem + ".txt", "w") as f:
+            f.write(summary + "\n")
+        print(f"Profiled {self.captured} frames into {stem}.pstats\n{summary}")
+
+
+class Tracer:
+    """Ring buffer of timed spans, saved as Chrome trace-event JSON.
+    
+    trace_begin()/trace_end() nest spans per thread; each closed span is
+    kept as (name, start, end, thread) and only the newest `capacity`
+    survive.  save() writes trace-<time>.json for chrome://tracing or
+    Perfetto with microsecond timestamps.
+    """
+    
+    def __init__(self, capacity=TRACE_EVENTS):
+        self.events = deque(maxlen=capacity)
+        self.origin = time.perf_counter()
+        self.local = threading.local()
+        self.thread_names = {}
+    
+    def begin(self, name):
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+            self.thread_names[threading.get_ident()] = threading.current_thread().name
+        stack.append((name, time.perf_counter()))
+    
+    def end(self):
+        stack = getattr(self.local, "stack", None)
+        if stack:
+            name, start = stack.pop()
+            self.events.append((name, start, time.perf_counter(), threading.get_ident()))
+    
+    def save(self):
+        path = time.strftime("trace-%Y%m%d-%H%M%S.json")
+        pid = os.getpid()
+        events = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+                  for tid, name in self.thread_names.items()]
+        for name, start, end, tid in list(self.events):
+            events.append({"name": name, "ph": "X", "pid": pid, "tid": tid,
+                           "ts": round((start - self.origin) * 1e6, 1), "dur": round((end - start) * 1e6, 1)})
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        print(f"Saved {len(events) - len(self.thread_names)} trace spans to {path}")
+        return path
+
+
+def deep_size(obj, seen=None):
+    """Approximate bytes held by obj and the containers and strings inside it."""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(key, seen) + deep_size(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(deep_size(item, seen) for item in obj)
+    return size
+
+
+def surface_bytes(surfaces):
+    return sum(surface.get_pitch() * surface.get_height() for surface in surfaces)
+
+
+class MemoryReport:
+    """tracemalloc checkpoints of a running Game, written to memory-<time>.txt.
+    
+    checkpoint() is called when a level has loaded, when it ends and every
+    MEMORY_REPORT_INTERVAL ticks.  Each one diffs a tracemalloc snapshot
+    against the previous checkpoint, attributes the growth to the class
+    (or module function) whose code made the allocation, and counts things
+    tracemalloc cannot see or that should not pile up: LEVELS, dead
+    entities still in the level lists, live Sound objects and cached
+    surfaces, whose pixels live in SDL memory.  Growth of more than
+    MEMORY_GROWTH_FLAG_KB from one level load to the next is flagged.
+    
+    Only the allocating line is traced by default; deeper tracebacks
+    attribute allocations made inside helpers better but cost ~20 ms a tick.
+    """
+    
+    def __init__(self, frames=1):
+        tracemalloc.start(frames)
+        self.path = time.strftime("memory-%Y%m%d-%H%M%S.txt")
+        self.sounds = weakref.WeakSet()
+        names = sorted((line, name) for (_, line, _), name in qualified_names().items())
+        self.code_lines = [line for line, _ in names]
+        self.code_names = [name for _, name in names]
+        self.previous = None
+        self.level_start = None
+        self.levels_held = len(LEVELS)
+    
+    def take_snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+    
+    def owner(self, traceback):
+        """Class, or "(module functions)", of the newest frame in this file that allocated."""
+        for frame in reversed(traceback):
+            if frame.filename == __file__:
+                index = bisect.bisect_right(self.code_lines, frame.lineno) - 1
+                if index < 0:
+                    break
+                name = self.code_names[index]
+                return name.split(".")[0] if "." in name else "(module functions)"
+        return "(other modules)"
+    
+    def growth_by_owner(self, snapshot, previous):
+        growth = {}
+        for diff in snapshot.compare_to(previous, "traceback"):
+            if diff.size_diff:
+                owner = self.owner(diff.traceback)
+                growth[owner] = growth.get(owner, 0) + diff.size_diff
+        return sorted(growth.items(), key=lambda item: -abs(item[1]))
+    
+    def census(self, game):
+        """(line, flag or None) pairs for memory tracemalloc does not attribute well."""
+        level = game.level
+        rows = []
+        levels_kb = deep_size(LEVELS) / 1024
+        flag = None
+        if len(LEVELS) > max(self.levels_held, game.max_levels):
+            flag = f"LEVELS grew from {self.levels_held} to {len(LEVELS)} levels"
+        rows.append((f"LEVELS: {len(LEVELS)} levels, {levels_kb:.0f} KB", flag))
+        self.levels_held = len(LEVELS)
+        
+        for name in Level.DRAW_LAYERS + ("particles",):
+            entities = getattr(level, name)
+            dead = sum(1 for entity in entities
+                       if not getattr(entity, "alive", True) or getattr(entity, "collected", False))
+            flag = None
+            if dead > 20 and dead * 2 > len(entities):
+                flag = f"Level.{name} still holds {dead} dead of {len(entities)}"
+            if entities:
+                rows.append((f"Level.{name}: {len(entities)} ({dead} dead)", flag))
+        
+        sounds = len(self.sounds)
+        rows.append((f"Sound objects alive: {sounds}",
+                     f"{sounds} generated Sound objects alive" if sounds > 50 else None))
+        layers = list(level.tile_layers.values()) + list(level.obs_tile_layers.values())
+        hud = [cached[2] for cached in getattr(game, "hud_cache", {}).values()]
+        rows.append((f"cached surfaces: {len(layers)} tile layers {surface_bytes(layers) / 1024:.0f} KB, "
+                     f"{len(hud)} HUD texts {surface_bytes(hud) / 1024:.0f} KB", None))
+        if game.rewind is not None:
+            rows.append((f"rewind buffer: {len(game.rewind.frames)} frames", None))
+        return rows
+    
+    def checkpoint(self, game, label, level_start=False):
+        snapshot = self.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"== {label} (tick {game.ticks}): {current / 1024:.0f} KB traced, peak {peak / 1024:.0f} KB"]
+        flags = []
+        if self.previous is not None:
+            lines.append("   KB since last checkpoint  owner")
+            for owner, size in self.growth_by_owner(snapshot, self.previous)[:8]:
+                lines.append(f"{size / 1024:+10.1f}  {owner}")
+        if level_start:
+            if self.level_start is not None:
+                growth = self.growth_by_owner(snapshot, self.level_start)
+                total = sum(size for _, size in growth)
+                if total > MEMORY_GROWTH_FLAG_KB * 1024:
+                    top = ", ".join(f"{owner} {size / 1024:+.0f} KB" for owner, size in growth[:3])
+                    flags.append(f"{total / 1024:+.0f} KB since the previous level load ({top})")
+            self.level_start = snapshot
+        for line, flag in self.census(game):
+            lines.append("  " + line)
+            if flag:
+                flags.append(flag)
+        lines += [f"  FLAG: {flag}" for flag in flags]
+        self.previous = snapshot
+        with open(self.path, "a") as f:
+            f.write("\n".join(lines) + "\n\n")
+        for flag in flags:
+            print(f"memory: {label}: {flag}")
 
 
 class Game:
-    def __init__(self):
-        pygame.init()
-        self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-        pygame.display.set_caption("SUPAR MAYRO - Ultimate Platformer!")
-        self.clock = pygame.time.Clock()
-        self.font = pygame.font.Font(None, 36)
-        self.large_font = pygame.font.Font(None, 72)
-        self.small_font = pygame.font.Font(None, 24)
+    SNAPSHOT_FIELDS = ("current_level", "state", "camera_x", "shake_timer", "shake_intensity",
+                       "combo_count", "combo_timer", "invincible_timer", "rapid_fire_timer",
+                       "magnet_active", "ticks", "deaths_by_cause")
+    
+    def __init__(self, endless_seed=None, level_width=None, headless=False, levels=None):
+        self.endless_seed = endless_seed
+        self.level_width = level_width
+        self.levels = LEVELS if levels is None else levels
+        self.headless = headless
+        if headless:
+            self.screen = None
+            self.clock = None
+            self.font = self.large_font = self.small_font = None
+        else:
+            # Only what the first frame needs; the mixer opens in start_deferred().
+            pygame.display.init()
+            pygame.font.init()
+            pygame.display.set_caption("SUPAR MAYRO - Ultimate Platformer!")
+            self.clock = pygame.time.Clock()
+            self.attach_screen(pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT)))
         
         self.current_level = 1
         self.max_levels = 10
+        self.input_keys = None
+        self.quick_save = None
+        self.rewind = None if headless else RewindBuffer()
+        self.ticks = 0
+        self.deaths_by_cause = {}
         
-        self.music = MusicPlayer()
+        self.music = MusicPlayer(enabled=not headless, deferred=True)
         
         self.shake_timer = 0
         self.shake_intensity = 0
+        self.shake_x = 0
         self.combo_count = 0
         self.combo_timer = 0
         self.invincible_timer = 0
@@ -1434,21 +3086,81 @@ class Game:
         
         self.reset_game()
     
+    def attach_screen(self, surface):
+        """Draw into surface from now on; headless games can be given one later."""
+        self.screen = surface
+        self.font = pygame.font.Font(None, 36)
+        self.large_font = pygame.font.Font(None, 72)
+        self.small_font = pygame.font.Font(None, 24)
+        self.hud_cache = {}
+        self.frames_drawn = 0
+    
+    def hud_text(self, slot, font, text, color):
+        """Rendered HUD text for one slot, reused until the text changes.
+        
+        At lower quality tiers changed text is only re-rendered every
+        QUALITY["hud_interval"] frames, so fast-changing values update less often.
+        """
+        cached = self.hud_cache.get(slot)
+        if cached is not None:
+            cached_text, cached_color, surface, frame = cached
+            if (cached_text, cached_color) == (text, color) or self.frames_drawn - frame < QUALITY["hud_interval"]:
+                return surface
+        surface = font.render(text, True, color)
+        self.hud_cache[slot] = (text, color, surface, self.frames_drawn)
+        return surface
+    
+    def level_data(self, level_num, rng=random):
+        """Generated data for level_num, generating and keeping it if it is missing or the wrong width."""
+        width = self.level_width or level_width_for(level_num)
+        with LEVELS_LOCK:
+            data = self.levels.get(level_num)
+            if data is None or len(data["map"][0]) != width:
+                generate = generate_level_np if self.level_width else generate_level
+                data = self.levels[level_num] = generate(level_num, width, (level_num % 3) == 0, rng)
+        return data
+    
+    def start_deferred(self):
+        """Open the mixer and generate the remaining levels on a background thread.
+        
+        The levels get their own Random so the thread never touches the
+        global generator the simulation uses.  Returns the thread.
+        """
+        rng = random.Random(random.getrandbits(64))
+        
+        def work():
+            self.music.start()
+            if self.endless_seed is None:
+                for level_num in range(1, self.max_levels + 1):
+                    self.level_data(level_num, rng)
+        
+        thread = threading.Thread(target=work, name="startup", daemon=True)
+        thread.start()
+        return thread
+    
     def reset_game(self):
-        if self.current_level not in LEVELS:
-            LEVELS[self.current_level] = generate_level(self.current_level, 50 + self.current_level * 10, (self.current_level % 3) == 0)
+        trace_begin("load_level")
+        if self.rewind is not None:
+            self.rewind.clear()
+        data = self.level_data(self.current_level)
         
-        self.level = Level(self.current_level)
-        self.player = Player(100, 10 * TILE_SIZE)
+        if self.endless_seed is not None:
+            self.level = EndlessLevel(self.endless_seed)
+        else:
+            self.level = Level(self.current_level, data)
+        self.player = Player(self.level.spawn_x, 10 * TILE_SIZE)
         self.camera_x = 0
         self.state = STATE_PLAYING
-        self.level_width = len(self.level.data["map"][0]) * TILE_SIZE
         self.shake_timer = 0
+        self.shake_x = 0
         self.combo_count = 0
         self.combo_timer = 0
         self.invincible_timer = 0
         self.rapid_fire_timer = 0
         self.magnet_active = False
+        if MEMORY is not None:
+            MEMORY.checkpoint(self, f"level {self.current_level} loaded", level_start=True)
+        trace_end()
     
     def add_shake(self, intensity, duration):
         self.shake_intensity = max(self.shake_intensity, intensity)
@@ -1459,7 +3171,9 @@ class Game:
             vel_x = random.uniform(-3, 3)
             vel_y = random.uniform(-5, -2)
             lifetime = random.randint(20, 40)
-            self.level.particles.append(Particle(x, y, color, (vel_x, vel_y), lifetime))
+            # The random draws above still happen when capped, so quality never changes the simulation.
+            if len(self.level.particles) < QUALITY["particles"]:
+                self.level.particles.append(Particle(x, y, color, (vel_x, vel_y), lifetime))
     
     def add_combo(self):
         self.combo_count += 1
@@ -1468,16 +3182,45 @@ class Game:
         self.player.score += bonus
     
     def next_level(self):
+        trace_begin("next_level")
+        if MEMORY is not None:
+            MEMORY.checkpoint(self, f"level {self.current_level} end")
         if self.current_level < self.max_levels:
             self.current_level += 1
             self.reset_game()
         else:
             self.state = STATE_WIN
             self.music.play_win()
+        trace_end()
+    
+    def music_track(self):
+        """The (level number, boss) background track for the current state, or None once the game is over or won."""
+        if self.state in (STATE_GAME_OVER, STATE_WIN):
+            return None
+        return self.current_level, self.state == STATE_BOSS
+    
+    def read_keys(self):
+        if self.input_keys is not None:
+            return self.input_keys
+        return pygame.key.get_pressed()
     
     def update(self):
+        if self.rewind is not None and self.state in (STATE_PLAYING, STATE_BOSS, STATE_GAME_OVER):
+            if not self.chat_active and self.read_keys()[pygame.K_BACKSPACE]:
+                parts = self.rewind.pop()
+                if parts is not None:
+                    self.restore_parts(parts)
+                return
+            if self.state != STATE_GAME_OVER:
+                self.rewind.record(self.state_parts())
+        
+        self.ticks += 1
+        if MEMORY is not None and self.ticks % MEMORY_REPORT_INTERVAL == 0:
+            MEMORY.checkpoint(self, "periodic")
         if self.state == STATE_BOSS:
+            trace_begin("update.boss")
             self.update_boss()
+            trace_end()
             return
         
         if self.state != STATE_PLAYING:
@@ -1499,7 +3242,8 @@ class Game:
         elif self.combo_count > 0:
             self.combo_count = 0
         
-        keys = pygame.key.get_pressed()
+        trace_begin("update.player")
+        keys = self.read_keys()
         
         if not self.chat_active:
             if keys[pygame.K_z] or keys[pygame.K_x]:
@@ -1509,20 +3253,26 @@ class Game:
                     self.shoot_key_held = True
             else:
                 self.shoot_key_held = False        
-            self.player.update(keys, self.level.tile_rects, self.level.moving_platforms)
+            self.player.update(keys, self.level.grid, self.level.moving_platforms)
         else:
             self.player.vel_x = 0
+        trace_end()
         
         target_camera_x = self.player.rect.x - SCREEN_WIDTH // 3
-        shake_x = random.randint(-self.shake_intensity, self.shake_intensity) if self.shake_timer > 0 else 0
-        shake_y = random.randint(-self.shake_intensity, self.shake_intensity) if self.shake_timer > 0 else 0
+        # Shake is only a draw offset (see RenderView), so camera_x and snapshots stay shake-free.
+        self.shake_x = random.randint(-self.shake_intensity, self.shake_intensity) if self.shake_timer > 0 else 0
         
         camera_lerp = 0.15
         self.camera_x = self.camera_x + (target_camera_x - self.camera_x) * camera_lerp
-        self.camera_x = max(0, min(self.camera_x + shake_x, self.level_width - SCREEN_WIDTH))
+        self.camera_x = max(self.level.grid.left, min(self.camera_x, self.level.grid.right - SCREEN_WIDTH))
         
-        self.level.update(self.player.rect)
+        trace_begin("update.level")
+        if self.endless_seed is not None:
+            self.level.stream(self.player.rect.x)
+        self.level.update(self.player.rect, self.player.bullets)
+        trace_end()
         
+        trace_begin("update.collisions")
         if self.magnet_active:
             for coin in self.level.coins:
                 if not coin.collected:
@@ -1561,122 +3311,122 @@ class Game:
             if self.player.rect.colliderect(enemy.rect):
                 if self.player.vel_y > 0 and self.player.rect.bottom < enemy.rect.centery + 10:
                     enemy.alive = False
-                    self.player.vel_y = JUMP_FORCE // 2
+                    self.player.vel_y = units(JUMP_FORCE // 2)
                     self.player.score += 200
                     self.music.play_hit()
                     self.add_combo()
                     self.add_shake(3, 5)
                     self.spawn_particles(enemy.rect.centerx, enemy.rect.centery, enemy.color, 10)
                 elif self.invincible_timer <= 0:
-                    self.player_died()
+                    self.player_died("enemy")
         
         for bat in self.level.bats:
             if bat.alive and self.player.rect.colliderect(bat.rect):
                 if self.player.vel_y > 0 and self.player.rect.bottom < bat.rect.centery:
                     bat.alive = False
-                    self.player.vel_y = JUMP_FORCE // 2
+                    self.player.vel_y = units(JUMP_FORCE // 2)
                     self.player.score += 250
                     self.music.play_hit()
                     self.add_combo()
                     self.add_shake(3, 5)
                     self.spawn_particles(bat.rect.centerx, bat.rect.centery, BAT_BLACK, 10)
                 elif self.invincible_timer <= 0:
-                    self.player_died()
+                    self.player_died("bat")
         
         for ghost in self.level.ghosts:
             if ghost.alive and self.player.rect.colliderect(ghost.rect):
                 if self.player.vel_y > 0 and self.player.rect.bottom < ghost.rect.centery:
                     ghost.alive = False
-                    self.player.vel_y = JUMP_FORCE // 2
+                    self.player.vel_y = units(JUMP_FORCE // 2)
                     self.player.score += 300
                     self.music.play_hit()
                     self.add_combo()
                     self.add_shake(4, 5)
                     self.spawn_particles(ghost.rect.centerx, ghost.rect.centery, GHOST_WHITE, 12)
                 elif self.invincible_timer <= 0:
-                    self.player_died()
+                    self.player_died("ghost")
         
         for slime in self.level.slimes:
             if slime.alive and self.player.rect.colliderect(slime.rect):
                 if self.player.vel_y > 0 and self.player.rect.bottom < slime.rect.centery:
                     slime.alive = False
-                    self.player.vel_y = JUMP_FORCE // 2
+                    self.player.vel_y = units(JUMP_FORCE // 2)
                     self.player.score += 350
                     self.music.play_hit()
                     self.add_combo()
                     self.add_shake(4, 5)
                     self.spawn_particles(slime.rect.centerx, slime.rect.centery, SLIME_GREEN, 12)
                 elif self.invincible_timer <= 0:
-                    self.player_died()
+                    self.player_died("slime")
         
         for teleporter in self.level.teleporters:
             if teleporter.alive and self.player.rect.colliderect(teleporter.rect):
                 if self.player.vel_y > 0 and self.player.rect.bottom < teleporter.rect.centery:
                     teleporter.alive = False
-                    self.player.vel_y = JUMP_FORCE // 2
+                    self.player.vel_y = units(JUMP_FORCE // 2)
                     self.player.score += 400
                     self.music.play_hit()
                     self.add_combo()
                     self.add_shake(5, 8)
                     self.spawn_particles(teleporter.rect.centerx, teleporter.rect.centery, TELEPORTER_PURPLE, 15)
                 elif self.invincible_timer <= 0:
-                    self.player_died()
+                    self.player_died("teleporter")
         
         for thief in self.level.thieves:
             if thief.alive and self.player.rect.colliderect(thief.rect):
                 if self.player.vel_y > 0 and self.player.rect.bottom < thief.rect.centery:
                     thief.alive = False
-                    self.player.vel_y = JUMP_FORCE // 2
+                    self.player.vel_y = units(JUMP_FORCE // 2)
                     self.player.score += 500
                     self.music.play_hit()
                     self.add_combo()
                     self.add_shake(4, 6)
                     self.spawn_particles(thief.rect.centerx, thief.rect.centery, THIEF_BLUE, 12)
                 elif self.invincible_timer <= 0:
-                    self.player_died()
+                    self.player_died("thief")
         
         for dodger in self.level.dodgers:
             if dodger.alive and self.player.rect.colliderect(dodger.rect):
                 if self.player.vel_y > 0 and self.player.rect.bottom < dodger.rect.centery:
                     dodger.alive = False
-                    self.player.vel_y = JUMP_FORCE // 2
+                    self.player.vel_y = units(JUMP_FORCE // 2)
                     self.player.score += 450
                     self.music.play_hit()
                     self.add_combo()
                     self.add_shake(4, 6)
                     self.spawn_particles(dodger.rect.centerx, dodger.rect.centery, ANNOYING_PINK, 12)
                 elif self.invincible_timer <= 0:
-                    self.player_died()
+                    self.player_died("dodger")
         
         for shielder in self.level.shielders:
             if shielder.alive and self.player.rect.colliderect(shielder.rect):
                 if self.player.vel_y > 0 and self.player.rect.bottom < shielder.rect.centery:
                     shielder.alive = False
-                    self.player.vel_y = JUMP_FORCE // 2
+                    self.player.vel_y = units(JUMP_FORCE // 2)
                     self.player.score += 600
                     self.music.play_hit()
                     self.add_combo()
                     self.add_shake(6, 10)
                     self.spawn_particles(shielder.rect.centerx, shielder.rect.centery, SHIELDER_GRAY, 15)
                 elif self.invincible_timer <= 0:
-                    self.player_died()
+                    self.player_died("shielder")
         
         for healer in self.level.healers:
             if healer.alive and self.player.rect.colliderect(healer.rect):
                 if self.player.vel_y > 0 and self.player.rect.bottom < healer.rect.centery:
                     healer.alive = False
-                    self.player.vel_y = JUMP_FORCE // 2
+                    self.player.vel_y = units(JUMP_FORCE // 2)
                     self.player.score += 550
                     self.music.play_hit()
                     self.add_combo()
                     self.add_shake(5, 8)
                     self.spawn_particles(healer.rect.centerx, healer.rect.centery, (50, 200, 100), 15)
                 elif self.invincible_timer <= 0:
-                    self.player_died()
+                    self.player_died("healer")
         
         for bullet in self.player.bullets[:]:
             for enemy in self.level.enemies:
-                if enemy.alive and bullet.rect.colliderect(enemy.rect):
+                if enemy.alive and bullet.swept.colliderect(enemy.rect):
                     enemy.alive = False
                     self.player.score += 200
                     self.music.play_hit()
@@ -1687,7 +3437,7 @@ class Game:
                         self.player.bullets.remove(bullet)
                     break
             
-            if self.level.boss and self.level.boss.alive and bullet.rect.colliderect(self.level.boss.rect):
+            if self.level.boss and self.level.boss.alive and bullet.swept.colliderect(self.level.boss.rect):
                 self.level.boss.take_damage()
                 self.player.score += 100
                 self.music.play_boss_hit()
@@ -1697,7 +3447,7 @@ class Game:
                     self.player.bullets.remove(bullet)
             
             for teleporter in self.level.teleporters:
-                if teleporter.alive and bullet.rect.colliderect(teleporter.rect):
+                if teleporter.alive and bullet.swept.colliderect(teleporter.rect):
                     teleporter.alive = False
                     self.player.score += 400
                     self.music.play_hit()
@@ -1709,7 +3459,7 @@ class Game:
                     break
             
             for thief in self.level.thieves:
-                if thief.alive and bullet.rect.colliderect(thief.rect):
+                if thief.alive and bullet.swept.colliderect(thief.rect):
                     thief.alive = False
                     self.player.score += 500
                     self.music.play_hit()
@@ -1721,7 +3471,7 @@ class Game:
                     break
             
             for dodger in self.level.dodgers:
-                if dodger.alive and bullet.rect.colliderect(dodger.rect):
+                if dodger.alive and bullet.swept.colliderect(dodger.rect):
                     if random.random() < 0.3:
                         dodger.alive = False
                         self.player.score += 450
@@ -1734,7 +3484,7 @@ class Game:
                     break
             
             for shielder in self.level.shielders:
-                if shielder.alive and bullet.rect.colliderect(shielder.rect):
+                if shielder.alive and bullet.swept.colliderect(shielder.rect):
                     shielder.alive = False
                     self.player.score += 600
                     self.music.play_hit()
@@ -1746,7 +3496,7 @@ class Game:
                     break
             
             for healer in self.level.healers:
-                if healer.alive and bullet.rect.colliderect(healer.rect):
+                if healer.alive and bullet.swept.colliderect(healer.rect):
                     healer.alive = False
                     self.player.score += 550
                     self.music.play_hit()
@@ -1759,7 +3509,7 @@ class Game:
         
         if self.level.boss and self.level.boss.alive:
             if self.player.rect.colliderect(self.level.boss.rect) and self.invincible_timer <= 0:
-                self.player_died()
+                self.player_died("boss")
             
             if not self.level.boss.alive:
                 self.player.score += 5000
@@ -1772,27 +3522,19 @@ class Game:
                     )
                 self.music.play_win()
                 self.next_level()
+        trace_end()
         
-        for tile in self.level.tiles:
-            if tile.type in (TILE_SPIKE, TILE_SPIKE_UP) and self.player.rect.colliderect(tile.rect):
-                if self.invincible_timer <= 0:
-                    self.player_died()
-        
-        for trap in self.level.traps:
-            if self.player.rect.colliderect(trap.rect):
-                if self.invincible_timer <= 0:
-                    self.player_died()
-        
-        for spike in self.level.falling_spikes:
-            if self.player.rect.colliderect(spike.rect):
-                if self.invincible_timer <= 0:
-                    self.player_died()
+        trace_begin("update.hazards")
+        hazard = self.level.hazards.hit(self.player.rect)
+        if hazard and self.invincible_timer <= 0:
+            self.player_died(hazard)
         
         if self.player.rect.y > SCREEN_HEIGHT:
-            self.player_died()
+            self.player_died("fall")
+        trace_end()
         
-        boss_door_x = self.level.data.get("boss_door_x", 0) * TILE_SIZE
-        if self.player.rect.x >= boss_door_x:
+        boss_door_x = self.level.data.get("boss_door_x", 0)
+        if boss_door_x is not None and self.player.rect.x >= boss_door_x * TILE_SIZE:
             if self.level.data.get("is_boss_level"):
                 self.state = STATE_BOSS
             else:
@@ -1800,13 +3542,13 @@ class Game:
                 self.next_level()
     
     def update_boss(self):
-        keys = pygame.key.get_pressed()
+        keys = self.read_keys()
         
         if not self.chat_active:
             if keys[pygame.K_z] or keys[pygame.K_x]:
                 self.player.shoot()
             
-            self.player.update(keys, self.level.tile_rects, [])
+            self.player.update(keys, self.level.grid, [])
         else:
             self.player.vel_x = 0
         
@@ -1814,29 +3556,31 @@ class Game:
         
         for bullet in self.player.bullets[:]:
             for enemy in self.level.boss.attacks:
-                if enemy.alive and bullet.rect.colliderect(enemy.rect):
+                if enemy.alive and bullet.swept.colliderect(enemy.rect):
                     enemy.alive = False
                     if bullet in self.player.bullets:
                         self.player.bullets.remove(bullet)
         
         if self.player.rect.colliderect(self.level.boss.rect):
-            self.player_died()
+            self.player_died("boss")
         
         for enemy in self.level.boss.attacks:
             if enemy.alive and self.player.rect.colliderect(enemy.rect):
-                self.player_died()
+                self.player_died("boss_attack")
         
         for bullet in self.player.bullets[:]:
-            if bullet.rect.colliderect(self.level.boss.rect):
+            if bullet.swept.colliderect(self.level.boss.rect):
                 self.level.boss.take_damage()
                 self.music.play_boss_hit()
                 if bullet in self.player.bullets:
                     self.player.bullets.remove(bullet)
         
         if self.player.rect.y > SCREEN_HEIGHT:
-            self.player_died()
+            self.player_died("fall")
     
-    def player_died(self):
+    def player_died(self, cause="unknown"):
+        trace_begin("player_died")
+        self.deaths_by_cause[cause] = self.deaths_by_cause.get(cause, 0) + 1
         self.music.play_death()
         self.add_shake(10, 20)
         self.spawn_particles(self.player.rect.centerx, self.player.rect.centery, SKIN_COLOR, 20)
@@ -1847,61 +3591,118 @@ class Game:
         if self.player.lives <= 0:
             self.state = STATE_GAME_OVER
         else:
-            self.player.rect.x = 100
             self.player.rect.y = 10 * TILE_SIZE
             self.player.vel_x = 0
             self.player.vel_y = 0
-            self.camera_x = 0
             if self.state == STATE_BOSS:
-                self.level.boss = Boss(500, 10 * TILE_SIZE - 80, self.level.data.get("boss_type", 0))
+                # update_boss never moves the camera, so respawn in the arena with the camera where the fight began.
+                self.player.rect.x = self.level.data.get("boss_arena", (self.level.spawn_x,))[0]
+                self.camera_x = max(self.level.grid.left, self.level.grid.right - SCREEN_WIDTH)
+                self.level.boss = self.level.make_boss()
+            else:
+                self.player.rect.x = self.level.spawn_x
+                self.camera_x = self.level.grid.left
+        trace_end()
     
-    def draw(self):
-        self.screen.fill(self.level.sky_color)
-        
-        self.level.draw(self.screen, self.camera_x)
-        
-        self.player.draw(self.screen, self.camera_x)
-        
-        score_text = self.font.render(f"Score: {self.player.score}", True, TEXT_COLOR)
-        lives_text = self.font.render(f"Lives: {self.player.lives}", True, TEXT_COLOR)
-        level_text = self.font.render(f"Level {self.current_level}: {self.level.name}", True, TEXT_COLOR)
+    def snapshot(self):
+        """Serialize the whole simulation state into a bytes buffer for restore().
+        
+        Covers the game timers, camera, player and bullets, every level entity
+        list, the boss and its attacks, and the global RNG.  Level maps are
+        looked up again from the game's levels, so a snapshot is only valid in the
+        process that took it.
+        """
+        fields = [getattr(self, name) for name in self.SNAPSHOT_FIELDS]
+        return pickle.dumps((fields, self.player, self.level.state(), random.getstate()), pickle.HIGHEST_PROTOCOL)
+    
+    def restore(self, snapshot):
+        self.apply_state(*pickle.loads(snapshot))
+    
+    def state_parts(self):
+        """The snapshot() state pickled as separate parts.
+        
+        Parts are header (game fields, spawn point and any endless stream
+        state), RNG, player, boss and particles, followed by one part per
+        Level.DRAW_LAYERS list, so lists nothing touched this tick produce
+        byte-identical parts.
+        """
+        entity_lists, particles, boss, spawn_x, *extra = self.level.state()
+        header = ([getattr(self, name) for name in self.SNAPSHOT_FIELDS], spawn_x, extra)
+        values = [header, random.getstate(), self.player, boss, particles] + entity_lists
+        return [pickle.dumps(value, pickle.HIGHEST_PROTOCOL) for value in values]
+    
+    def restore_parts(self, parts):
+        (fields, spawn_x, extra), rng_state, player, boss, particles, *entity_lists = map(pickle.loads, parts)
+        self.apply_state(fields, player, (entity_lists, particles, boss, spawn_x, *extra), rng_state)
+    
+    def apply_state(self, fields, player, level_state, rng_state):
+        self.player = player
+        for name, value in zip(self.SNAPSHOT_FIELDS, fields):
+            setattr(self, name, value)
+        if self.endless_seed is None and self.level.level_num != self.current_level:
+            self.level = Level(self.current_level, self.level_data(self.current_level))
+        self.level.set_state(level_state)
+        random.setstate(rng_state)
+    
+    def draw(self, view=None):
+        """Draw a RenderView of this game, by default one of its current state."""
+        if view is None:
+            view = RenderView(self)
+        self.frames_drawn += 1
+        trace_begin("draw.tiles")
+        self.screen.fill(view.sky_color)
+        
+        for x, layer in view.chunks:
+            self.screen.blit(layer, (x, 0))
+        trace_end()
+        trace_begin("draw.entities")
+        for entity in view.entities:
+            entity.draw(self.screen, view.camera_x)
+        
+        view.player.draw(self.screen, view.camera_x)
+        trace_end()
+        
+        trace_begin("draw.hud")
+        score_text = self.hud_text("score", self.font, f"Score: {view.score}", TEXT_COLOR)
+        lives_text = self.hud_text("lives", self.font, f"Lives: {view.lives}", TEXT_COLOR)
+        level_text = self.hud_text("level", self.font, f"Level {view.current_level}: {view.level_name}", TEXT_COLOR)
         
         self.screen.blit(score_text, (10, 10))
         self.screen.blit(lives_text, (SCREEN_WIDTH - 120, 10))
         self.screen.blit(level_text, (SCREEN_WIDTH // 2 - 120, 10))
         
-        if self.state == STATE_BOSS and self.level.boss:
-            boss_text = self.large_font.render(self.level.boss.name, True, TRAP_RED)
+        if view.state == STATE_BOSS and view.boss_name:
+            boss_text = self.hud_text("boss", self.large_font, view.boss_name, TRAP_RED)
             self.screen.blit(boss_text, (SCREEN_WIDTH // 2 - 150, 50))
         
-        if self.combo_count > 1:
-            combo_color = (255, 255 - min(self.combo_count * 20, 200), 0)
-            combo_text = self.font.render(f"COMBO x{self.combo_count}!", True, combo_color)
-            combo_y = 50 + int(5 * math.sin(pygame.time.get_ticks() * 0.01))
+        if view.combo_count > 1:
+            combo_color = (255, 255 - min(view.combo_count * 20, 200), 0)
+            combo_text = self.hud_text("combo", self.font, f"COMBO x{view.combo_count}!", combo_color)
+            combo_y = 50 + int(5 * math.sin(self.frames_drawn / 6))
             self.screen.blit(combo_text, (SCREEN_WIDTH // 2 - 80, combo_y))
         
         powerup_y = 50
-        if self.invincible_timer > 0:
-            shield_text = self.small_font.render(f"SHIELD: {self.invincible_timer // 60}s", True, (255, 215, 0))
+        if view.invincible_timer > 0:
+            shield_text = self.hud_text("shield", self.small_font, f"SHIELD: {view.invincible_timer // 60}s", (255, 215, 0))
             self.screen.blit(shield_text, (SCREEN_WIDTH - 150, powerup_y))
             powerup_y += 25
-        if self.rapid_fire_timer > 0:
-            rapid_text = self.small_font.render(f"RAPID: {self.rapid_fire_timer // 60}s", True, (50, 150, 255))
+        if view.rapid_fire_timer > 0:
+            rapid_text = self.hud_text("rapid", self.small_font, f"RAPID: {view.rapid_fire_timer // 60}s", (50, 150, 255))
             self.screen.blit(rapid_text, (SCREEN_WIDTH - 150, powerup_y))
         
-        if self.chat_active:
+        if view.chat_active:
             chat_bg = pygame.Surface((SCREEN_WIDTH - 40, 40), pygame.SRCALPHA)
             chat_bg.fill((0, 0, 0, 180))
             self.screen.blit(chat_bg, (20, SCREEN_HEIGHT - 60))
-            chat_prompt = self.font.render("> " + self.chat_text, True, WHITE)
+            chat_prompt = self.font.render("> " + view.chat_text, True, WHITE)
             self.screen.blit(chat_prompt, (30, SCREEN_HEIGHT - 55))
-            if pygame.time.get_ticks() % 1000 < 500:
+            if self.frames_drawn % FPS < FPS // 2:
                 cursor_x = 30 + chat_prompt.get_width()
                 pygame.draw.line(self.screen, WHITE, (cursor_x, SCREEN_HEIGHT - 55), (cursor_x, SCREEN_HEIGHT - 30), 2)
         
-        if len(self.chat_history) > 0:
+        if len(view.chat_history) > 0:
             y_offset = SCREEN_HEIGHT - 100
-            for msg in self.chat_history[-3:]:
+            for msg in view.chat_history[-3:]:
                 chat_msg = self.small_font.render(msg, True, (220, 220, 220))
                 msg_bg = pygame.Surface((chat_msg.get_width() + 10, chat_msg.get_height() + 4), pygame.SRCALPHA)
                 msg_bg.fill((0, 0, 0, 120))
@@ -1909,17 +3710,17 @@ class Game:
                 self.screen.blit(chat_msg, (25, y_offset + 2))
                 y_offset -= 25
         
-        controls_text = self.small_font.render("ARROWS: Move | SPACE: Jump | Z/X: Shoot | P: Pause | T: Chat", True, BLACK)
+        controls_text = self.hud_text("controls", self.small_font, "ARROWS: Move | SPACE: Jump | Z/X: Shoot | P: Pause | T: Chat", BLACK)
         self.screen.blit(controls_text, (10, SCREEN_HEIGHT - 30))
         
-        if self.state == STATE_PAUSED:
+        if view.state == STATE_PAUSED:
             overlay = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
             overlay.fill((0, 0, 0, 128))
             self.screen.blit(overlay, (0, 0))
             text = self.large_font.render("PAUSED", True, WHITE)
             self.screen.blit(text, text.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT//2)))
         
-        elif self.state == STATE_GAME_OVER:
+        elif view.state == STATE_GAME_OVER:
             overlay = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
             overlay.fill((0, 0, 0, 128))
             self.screen.blit(overlay, (0, 0))
@@ -1928,63 +3729,1007 @@ class Game:
             restart_text = self.font.render("Press R to Restart", True, WHITE)
             self.screen.blit(restart_text, restart_text.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT//2 + 50)))
         
-        elif self.state == STATE_WIN:
+        elif view.state == STATE_WIN:
             overlay = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
             overlay.fill((0, 0, 0, 128))
             self.screen.blit(overlay, (0, 0))
             text = self.large_font.render("YOU WIN!", True, COIN_GOLD)
             self.screen.blit(text, text.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT//2 - 20)))
-            score_text = self.font.render(f"Final Score: {self.player.score}", True, WHITE)
+            score_text = self.font.render(f"Final Score: {view.score}", True, WHITE)
             self.screen.blit(score_text, score_text.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT//2 + 30)))
-        
+        trace_end()
+    
+    def handle_key(self, event):
+        """Apply one KEYDOWN event to the game."""
+        if self.chat_active:
+            if event.key == pygame.K_RETURN:
+                if self.chat_text.strip():
+                    self.chat_history.append(self.chat_text)
+                    if len(self.chat_history) > 5:
+                        self.chat_history.pop(0)
+                self.chat_text = ""
+                self.chat_active = False
+            elif event.key == pygame.K_ESCAPE:
+                self.chat_text = ""
+                self.chat_active = False
+            elif event.key == pygame.K_BACKSPACE:
+                self.chat_text = self.chat_text[:-1]
+            elif event.unicode and event.unicode.isprintable():
+                self.chat_text += event.unicode
+        else:
+            if event.key == pygame.K_t and self.state == STATE_PLAYING:
+                self.chat_active = True
+                self.chat_text = ""
+            elif event.key == pygame.K_p and self.state == STATE_PLAYING:
+                self.state = STATE_PAUSED
+            elif event.key == pygame.K_p and self.state == STATE_PAUSED:
+                self.state = STATE_PLAYING
+            elif event.key == pygame.K_F5:
+                self.quick_save = self.snapshot()
+            elif event.key == pygame.K_F9 and self.quick_save is not None:
+                self.restore(self.quick_save)
+            elif event.key == pygame.K_r and self.state in (STATE_GAME_OVER, STATE_WIN):
+                self.current_level = 1
+                self.reset_game()
+            elif event.key == pygame.K_SPACE or event.key == pygame.K_w:
+                if self.state == STATE_PLAYING and self.player.on_ground and not self.chat_active:
+                    self.music.play_jump()
+    
+    def run(self, pipelined=False, quality=None, profile_frames=None):
+        """Play until the window closes.
+        
+        quality pins one of QUALITY_TIERS; by default a QualityGovernor
+        picks the tier from measured frame times.  profile_frames profiles
+        that many frames from the start; F12 profiles the next ones.  With
+        TRACER set, F11 saves the trace buffer, as does quitting.
+        """
+        self.draw()
         pygame.display.flip()
+        self.start_deferred()
+        self.profiler = FrameProfiler(profile_frames or PROFILE_FRAMES)
+        if profile_frames:
+            self.profiler.start()
+            self.profiler.begin()
+        if quality is None:
+            self.governor = QualityGovernor()
+        else:
+            self.governor = None
+            set_quality_tier(quality)
+        if pipelined:
+            self.run_pipelined()
+        else:
+            running = True
+            while running:
+                trace_begin("frame")
+                profile = self.profiler.profile()
+                if profile:
+                    profile.enable()
+                trace_begin("events")
+                for event in pygame.event.get():
+                    if event.type == pygame.QUIT:
+                        running = False
+                    elif event.type == pygame.KEYDOWN and event.key == pygame.K_F12:
+                        self.profiler.start()
+                    elif event.type == pygame.KEYDOWN and event.key == pygame.K_F11 and TRACER:
+                        TRACER.save()
+                    elif event.type == pygame.KEYDOWN:
+                        self.handle_key(event)
+                trace_end()
+                
+                trace_begin("update")
+                self.update()
+                trace_end()
+                self.music.flush(self.music_track())
+                trace_begin("draw")
+                self.draw()
+                trace_end()
+                trace_begin("flip")
+                pygame.display.flip()
+                trace_end()
+                if profile:
+                    profile.disable()
+                self.profiler.frame_done()
+                trace_begin("wait")
+                self.clock.tick(FPS)
+                trace_end()
+                if self.governor:
+                    self.governor.record(self.clock.get_rawtime())
+                trace_end()
+        
+        if TRACER:
+            TRACER.save()
+        pygame.quit()
+        sys.exit()
     
-    def run(self):
+    def run_pipelined(self):
+        """Simulate the next tick on a worker thread while the main thread draws this one.
+        
+        Key events go to the worker along with each tick, so only the worker
+        touches game state; the main thread draws the frozen RenderView the
+        worker produced for the previous tick and owns the display.
+        
+        pygame holds the GIL in fill, blit and draw calls, so the worker only
+        really runs during the display flip and the frame limiter's sleep.
+        The thread handoffs can cost more than that buys: on one core this
+        measured about 0.9x the speed of run().
+        """
+        ticks = queue.Queue()
+        views = queue.Queue(maxsize=1)
+        
+        def simulate():
+            while True:
+                events = ticks.get()
+                if events is None:
+                    return
+                profile = self.profiler.profile()
+                if profile:
+                    profile.enable()
+                try:
+                    trace_begin("update")
+                    for event in events:
+                        self.handle_key(event)
+                    self.update()
+                    self.music.flush(self.music_track())
+                    view = RenderView(self, frozen=True)
+                    trace_end()
+                    if profile:
+                        profile.disable()
+                    views.put(view)
+                except Exception as error:
+                    views.put(error)
+                    return
+        
+        worker = threading.Thread(target=simulate, name="simulation", daemon=True)
+        worker.start()
+        ticks.put([])
         running = True
-        
         while running:
+            trace_begin("frame")
+            trace_begin("wait.simulation")
+            view = views.get()
+            trace_end()
+            if isinstance(view, Exception):
+                raise view
+            # The worker is idle until the next tick is queued, so a finished capture can be saved here.
+            self.profiler.frame_done()
+            profile = self.profiler.profile()
+            if profile:
+                profile.enable()
+            events = []
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     running = False
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_F12:
+                    self.profiler.start()
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_F11 and TRACER:
+                    TRACER.save()
                 elif event.type == pygame.KEYDOWN:
-                    if self.chat_active:
-                        if event.key == pygame.K_RETURN:
-                            if self.chat_text.strip():
-                                self.chat_history.append(self.chat_text)
-                                if len(self.chat_history) > 5:
-                                    self.chat_history.pop(0)
-                            self.chat_text = ""
-                            self.chat_active = False
-                        elif event.key == pygame.K_ESCAPE:
-                            self.chat_text = ""
-                            self.chat_active = False
-                        elif event.key == pygame.K_BACKSPACE:
-                            self.chat_text = self.chat_text[:-1]
-                        elif event.unicode and event.unicode.isprintable():
-                            self.chat_text += event.unicode
-                    else:
-                        if event.key == pygame.K_t and self.state == STATE_PLAYING:
-                            self.chat_active = True
-                            self.chat_text = ""
-                        elif event.key == pygame.K_p and self.state == STATE_PLAYING:
-                            self.state = STATE_PAUSED
-                        elif event.key == pygame.K_p and self.state == STATE_PAUSED:
-                            self.state = STATE_PLAYING
-                        elif event.key == pygame.K_r and self.state in (STATE_GAME_OVER, STATE_WIN):
-                            self.current_level = 1
-                            self.reset_game()
-                        elif event.key == pygame.K_SPACE or event.key == pygame.K_w:
-                            if self.state == STATE_PLAYING and self.player.on_ground and not self.chat_active:
-                                self.music.play_jump()
-            
-            self.update()
-            self.draw()
+                    events.append(event)
+            if running:
+                ticks.put(events)
+            trace_begin("draw")
+            self.draw(view)
+            trace_end()
+            trace_begin("flip")
+            pygame.display.flip()
+            trace_end()
+            if profile:
+                profile.disable()
+            trace_begin("wait")
             self.clock.tick(FPS)
-        
-        pygame.quit()
-        sys.exit()
+            trace_end()
+            if self.governor:
+                self.governor.record(self.clock.get_rawtime())
+            trace_end()
+        ticks.put(None)
+        worker.join()
 
 
-if __name__ == "__main__":
+class IdleBot:
+    """Never presses anything; useful as a baseline for hazard-only deaths."""
+    
+    def __call__(self, game):
+        return KeyState()
+
+
+class RunnerBot:
+    """Runs right, jumps at pits, walls and spikes ahead, and shoots in bursts."""
+    
+    def __init__(self):
+        self.jump_held = False
+    
+    def __call__(self, game):
+        player = game.player
+        grid = game.level.grid
+        pressed = {pygame.K_RIGHT}
+        if game.ticks % 20 < 10:
+            pressed.add(pygame.K_z)
+        
+        ahead_col = (player.rect.right + TILE_SIZE // 2) // TILE_SIZE
+        foot_row = player.rect.bottom // TILE_SIZE
+        gap_ahead = not grid.is_solid(ahead_col, foot_row) or not grid.is_solid(ahead_col + 1, foot_row)
+        wall_ahead = grid.is_solid(ahead_col, foot_row - 1)
+        falling_into_gap = player.vel_y > 0 and not grid.is_solid(player.rect.centerx // TILE_SIZE, foot_row + 1)
+        
+        want_jump = (player.on_ground and (gap_ahead or wall_ahead)) or (not player.on_ground and falling_into_gap)
+        if want_jump and not self.jump_held:
+            pressed.add(pygame.K_SPACE)
+            self.jump_held = True
+        else:
+            self.jump_held = False
+        return KeyState(pressed)
+
+
+BOTS = {
+    "idle": IdleBot,
+    "runner": RunnerBot,
+}
+
+
+ACTION_LEFT = 1
+ACTION_RIGHT = 2
+ACTION_JUMP = 4
+ACTION_SHOOT = 8
+ACTION_COUNT = 16
+ACTION_KEYS = [KeyState(key for flag, key in ((ACTION_LEFT, pygame.K_LEFT), (ACTION_RIGHT, pygame.K_RIGHT),
+                                              (ACTION_JUMP, pygame.K_SPACE), (ACTION_SHOOT, pygame.K_z))
+                        if action & flag)
+               for action in range(ACTION_COUNT)]
+
+OBS_PLAYER_FEATURES = 9
+OBS_PATCH_COLS = 9
+OBS_PATCH_ROWS = 7
+OBS_HOSTILES = 4
+OBS_HOSTILE_RANGE = 10 * TILE_SIZE
+OBS_SIZE = OBS_PLAYER_FEATURES + OBS_PATCH_COLS * OBS_PATCH_ROWS + OBS_HOSTILES * 3
+OBS_TILE_CLASSES = bytes(1 if tile in SOLID_TILES else 2 if tile in HAZARD_TILES else 0 for tile in range(256))
+
+
+class PlatformerEnv:
+    """Gym-style wrapper around a headless Game for bots and training.
+    
+    reset(seed) returns an observation and step(action) returns
+    (observation, reward, done, info).  Actions are ints below ACTION_COUNT
+    made of the ACTION_* bit flags.  Observations are array('f') of OBS_SIZE
+    floats: player features, the tile patch around the player (0 empty,
+    1 solid, 2 hazard, row by row) and the offset in tiles of the nearest
+    hostiles.  Reward is the score gained times score_scale minus
+    death_penalty per life lost.  Each env generates its own levels and
+    runs on its own random state, swapped in around reset() and step() the
+    way RollbackSession does, so episodes only depend on the seed and the
+    actions taken, even with other envs stepped in between.
+    
+    Every step runs the full game simulation, which manages roughly 3k
+    ticks per second on one core; frame_skip repeats an action for several
+    ticks and saves the observation cost in between, not simulation time.
+    For more throughput run one VectorEnv per core.
+    """
+    
+    HOSTILE_TYPES = (Enemy, Bat, Ghost, Slime, Teleporter, Thief, Dodger, Shielder, Healer, SpikeTrap, FallingSpike)
+    
+    def __init__(self, level_width=None, max_ticks=36000, frame_skip=1, score_scale=0.01, death_penalty=1.0):
+        self.level_width = level_width
+        self.max_ticks = max_ticks
+        self.frame_skip = frame_skip
+        self.score_scale = score_scale
+        self.death_penalty = death_penalty
+        self.game = None
+        self.rng_state = None
+    
+    def reset(self, seed=None):
+        if seed is None:
+            seed = random.getrandbits(64)
+        saved_rng = random.getstate()
+        random.seed(seed)
+        self.game = Game(level_width=self.level_width, headless=True, levels={})
+        self.rng_state = random.getstate()
+        random.setstate(saved_rng)
+        self.score = 0
+        self.lives = self.game.player.lives
+        return self.observe()
+    
+    def step(self, action):
+        game = self.game
+        game.input_keys = ACTION_KEYS[action]
+        saved_rng = random.getstate()
+        random.setstate(self.rng_state)
+        for _ in range(self.frame_skip):
+            game.update()
+            if game.state not in (STATE_PLAYING, STATE_BOSS):
+                break
+        self.rng_state = random.getstate()
+        random.setstate(saved_rng)
+        player = game.player
+        reward = (player.score - self.score) * self.score_scale - (self.lives - player.lives) * self.death_penalty
+        self.score = player.score
+        self.lives = player.lives
+        truncated = game.ticks >= self.max_ticks
+        done = truncated or game.state not in (STATE_PLAYING, STATE_BOSS)
+        info = {"level": game.current_level, "score": player.score, "ticks": game.ticks, "truncated": truncated}
+        return self.observe(), reward, done, info
+    
+    def observe(self):
+        game = self.game
+        player = game.player
+        rect = player.rect
+        grid = game.level.grid
+        obs = array.array('f', (
+            (rect.x - grid.left) / max(1, grid.right - grid.left),
+            rect.y / SCREEN_HEIGHT,
+            player.vel_x / units(PLAYER_SPEED),
+            player.vel_y / units(MAX_FALL_SPEED),
+            player.on_ground,
+            player.jumps_left,
+            player.lives,
+            game.invincible_timer > 0,
+            player.shoot_cooldown == 0,
+        ))
+        
+        first_col = rect.centerx // TILE_SIZE - OBS_PATCH_COLS // 2 - grid.col_offset
+        first_row = rect.centery // TILE_SIZE - OBS_PATCH_ROWS // 2
+        for row in range(first_row, first_row + OBS_PATCH_ROWS):
+            if not 0 <= row < grid.rows:
+                obs.extend(bytes(OBS_PATCH_COLS))
+                continue
+            lo = max(0, first_col)
+            hi = max(lo, min(grid.cols, first_col + OBS_PATCH_COLS))
+            # Columns past either end of the level read as walls.
+            obs.extend(b"\x01" * (lo - first_col))
+            obs.extend(grid.map[row][lo:hi].translate(OBS_TILE_CLASSES))
+            obs.extend(b"\x01" * (first_col + OBS_PATCH_COLS - hi))
+        
+        hostiles = [entity for entity in game.level.entity_index.window(rect.x - OBS_HOSTILE_RANGE, rect.x + OBS_HOSTILE_RANGE)
+                    if isinstance(entity, self.HOSTILE_TYPES) and getattr(entity, "alive", True)
+                    and entity.rect.top < SCREEN_HEIGHT]
+        boss = game.level.boss
+        if game.state == STATE_BOSS and boss and boss.alive:
+            hostiles.append(boss)
+            hostiles.extend(attack for attack in boss.attacks if attack.alive)
+        cx, cy = rect.center
+        hostiles.sort(key=lambda entity: (entity.rect.centerx - cx) ** 2 + (entity.rect.centery - cy) ** 2)
+        for entity in hostiles[:OBS_HOSTILES]:
+            obs.extend(((entity.rect.centerx - cx) / TILE_SIZE, (entity.rect.centery - cy) / TILE_SIZE, 1.0))
+        obs.extend(bytes(3 * (OBS_HOSTILES - min(OBS_HOSTILES, len(hostiles)))))
+        return obs
+
+
+class VectorEnv:
+    """Several PlatformerEnv instances stepped in lockstep in one process.
+    
+    step(actions) takes one action per env and returns (observations,
+    rewards, dones, infos); finished envs are reset with the next unused
+    seed and report the final step in their info.  Observations are a
+    (count, OBS_SIZE) float32 numpy array when numpy is installed, otherwise
+    a list of array('f').  Each env keeps its own random state, so every
+    env's episodes are reproducible from its seed and actions alone.
+    """
+    
+    def __init__(self, count, seed=0, **env_kwargs):
+        self.envs = [PlatformerEnv(**env_kwargs) for _ in range(count)]
+        self.seed = seed
+        self.next_seed = seed
+    
+    def _batch(self, observations):
+        if np is None:
+            return observations
+        return np.frombuffer(b"".join(obs.tobytes() for obs in observations), dtype=np.float32).reshape(len(observations), OBS_SIZE)
+    
+    def reset(self):
+        self.next_seed = self.seed + len(self.envs)
+        return self._batch([env.reset(self.seed + i) for i, env in enumerate(self.envs)])
+    
+    def step(self, actions):
+        observations = []
+        rewards = []
+        dones = []
+        infos = []
+        for env, action in zip(self.envs, actions):
+            obs, reward, done, info = env.step(action)
+            if done:
+                info["final_observation"] = obs
+                obs = env.reset(self.next_seed)
+                self.next_seed += 1
+            observations.append(obs)
+            rewards.append(reward)
+            dones.append(done)
+            infos.append(info)
+        return self._batch(observations), rewards, dones, infos
+    
+    def render(self, renderer):
+        """Draw every env's current frame with an ObservationRenderer into one batch."""
+        return renderer.render_batch([env.game for env in self.envs])
+
+
+OBS_VIEW_COLS = SCREEN_WIDTH // TILE_SIZE + 1
+OBS_VIEW_ROWS = SCREEN_HEIGHT // TILE_SIZE
+OBS_CELL_PICKUP = 3
+OBS_CELL_PLATFORM = 4
+OBS_CELL_HOSTILE = 5
+OBS_CELL_PLAYER = 6
+# Index 0 is the tile layer colour key, which no gray maps to.
+OBS_PALETTE = [TILE_LAYER_KEY] + [(i, i, i) for i in range(1, 256)]
+
+
+class ObservationRenderer:
+    """Low-resolution frames drawn straight from level state, without Game.draw.
+    
+    mode "gray" draws the camera view into a width x height grayscale frame:
+    tiles come from the level's cached tile layers, shrunk once per chunk,
+    and entities are boxes in their main colour.  mode "semantic" gives one
+    cell per visible tile (OBS_VIEW_ROWS x OBS_VIEW_COLS) holding the
+    OBS_TILE_CLASSES value with pickups, platforms, hostiles and the player
+    stamped on top as OBS_CELL_*.  Frames are uint8 numpy arrays, or bytes
+    rows when numpy is not installed.
+    """
+    
+    ENTITY_COLORS = {
+        Player: SHIRT_COLOR, Bullet: CRAZY_YELLOW, Coin: COIN_GOLD, PowerUp: (255, 50, 50),
+        MovingPlatform: PLATFORM_BLUE, Bat: BAT_BLACK, Ghost: GHOST_WHITE, Slime: SLIME_GREEN,
+        Teleporter: TELEPORTER_PURPLE, Thief: THIEF_BLUE, Dodger: ANNOYING_PINK, Shielder: SHIELDER_GRAY,
+        Healer: (50, 200, 100), SpikeTrap: TRAP_RED, FallingSpike: TRAP_RED,
+    }
+    
+    def __init__(self, width=84, height=84, mode="gray"):
+        if mode not in ("gray", "semantic"):
+            raise ValueError(f"unknown observation mode {mode!r}")
+        self.mode = mode
+        if mode == "gray":
+            self.shape = (height, width)
+            self.scale_x = width / SCREEN_WIDTH
+            self.scale_y = height / SCREEN_HEIGHT
+            self.chunk_size = (math.ceil(RENDER_CHUNK_COLS * TILE_SIZE * self.scale_x),
+                               math.ceil(OBS_VIEW_ROWS * TILE_SIZE * self.scale_y))
+            self.frame = pygame.Surface((width, height), depth=8)
+            self.frame.set_palette(OBS_PALETTE)
+            self.shades = {}
+        else:
+            self.shape = (OBS_VIEW_ROWS, OBS_VIEW_COLS)
+    
+    def render(self, game):
+        data = self.render_bytes(game)
+        if np is None:
+            return data
+        return np.frombuffer(data, dtype=np.uint8).reshape(self.shape)
+    
+    def render_batch(self, games):
+        """Frames for several games as one (len(games), *shape) array."""
+        data = b"".join(self.render_bytes(game) for game in games)
+        if np is None:
+            return data
+        return np.frombuffer(data, dtype=np.uint8).reshape((len(games),) + self.shape)
+    
+    def render_bytes(self, game):
+        if self.mode == "gray":
+            return self.draw_gray(game)
+        return self.draw_semantic(game)
+    
+    def visible(self, game):
+        """Entities in the camera view, with the boss, its attacks and the player's bullets."""
+        camera_x = game.camera_x
+        level = game.level
+        entities = level.entity_index.window(camera_x - DRAW_MARGIN, camera_x + SCREEN_WIDTH + DRAW_MARGIN)
+        if level.boss and level.boss.alive:
+            entities.append(level.boss)
+            entities.extend(level.boss.attacks)
+        entities.extend(game.player.bullets)
+        return entities
+    
+    def shade(self, color):
+        """Gray level of a colour, never the see-through index 0."""
+        index = self.shades.get(color)
+        if index is None:
+            index = self.shades[color] = max(1, (299 * color[0] + 587 * color[1] + 114 * color[2]) // 1000)
+        return index
+    
+    def draw_gray(self, game):
+        level = game.level
+        frame = self.frame
+        camera_x = game.camera_x
+        scale_x = self.scale_x
+        scale_y = self.scale_y
+        frame.fill(self.shade(level.sky_color))
+        
+        chunk_width = RENDER_CHUNK_COLS * TILE_SIZE
+        first_chunk = max(level.grid.left, int(camera_x)) // chunk_width
+        last_chunk = min(level.grid.right - 1, int(camera_x) + SCREEN_WIDTH) // chunk_width
+        for chunk in range(first_chunk, last_chunk + 1):
+            frame.blit(level.obs_tile_layer(chunk, self.chunk_size),
+                       (math.floor((chunk * chunk_width - camera_x) * scale_x), 0))
+        
+        for entity in self.visible(game) + [game.player]:
+            rect = entity.rect
+            left = math.floor((rect.x - camera_x) * scale_x)
+            top = math.floor(rect.y * scale_y)
+            color = getattr(entity, "color", None) or self.ENTITY_COLORS.get(type(entity), WHITE)
+            frame.fill(self.shade(color), (left, top,
+                               max(1, math.ceil((rect.right - camera_x) * scale_x) - left),
+                               max(1, math.ceil(rect.bottom * scale_y) - top)))
+        return pygame.image.tobytes(frame, "P")
+    
+    def draw_semantic(self, game):
+        grid = game.level.grid
+        first_col = int(game.camera_x) // TILE_SIZE
+        lo = min(max(0, first_col - grid.col_offset), grid.cols)
+        hi = min(max(0, first_col - grid.col_offset + OBS_VIEW_COLS), grid.cols)
+        # Columns past either end of the level read as walls, as in PlatformerEnv.observe.
+        left_wall = b"\x01" * (lo - (first_col - grid.col_offset))
+        right_wall = b"\x01" * (OBS_VIEW_COLS - len(left_wall) - (hi - lo))
+        cells = bytearray(b"".join(left_wall + grid.map[row][lo:hi].translate(OBS_TILE_CLASSES) + right_wall
+                                   for row in range(OBS_VIEW_ROWS)))
+        
+        for entity in self.visible(game):
+            if isinstance(entity, (Coin, PowerUp)):
+                value = OBS_CELL_PICKUP
+            elif isinstance(entity, MovingPlatform):
+                value = OBS_CELL_PLATFORM
+            elif isinstance(entity, Bullet) or not getattr(entity, "alive", True):
+                continue
+            else:
+                value = OBS_CELL_HOSTILE
+            self.stamp(cells, entity.rect, first_col, value)
+        self.stamp(cells, game.player.rect, first_col, OBS_CELL_PLAYER)
+        return bytes(cells)
+    
+    def stamp(self, cells, rect, first_col, value):
+        """Mark every view cell the rect overlaps."""
+        col_lo = max(0, rect.left // TILE_SIZE - first_col)
+        col_hi = min(OBS_VIEW_COLS, (rect.right - 1) // TILE_SIZE - first_col + 1)
+        row_lo = max(0, rect.top // TILE_SIZE)
+        row_hi = min(OBS_VIEW_ROWS, (rect.bottom - 1) // TILE_SIZE + 1)
+        if col_lo >= col_hi:
+            return
+        for row in range(row_lo, row_hi):
+            start = row * OBS_VIEW_COLS
+            cells[start + col_lo:start + col_hi] = bytes((value,)) * (col_hi - col_lo)
+
+
+VERSUS_PORT = 47300
+ROLLBACK_INPUT_DELAY = 2
+ROLLBACK_MAX_FRAMES = 12
+ROLLBACK_PACKET_INPUTS = 64
+ROLLBACK_HEADER = struct.Struct("!4sIIB")
+
+
+def keys_to_action(keys):
+    """ACTION_* flags for a pygame key state, using the same keys as Player.update."""
+    return ((ACTION_LEFT if keys[pygame.K_LEFT] or keys[pygame.K_a] else 0)
+            | (ACTION_RIGHT if keys[pygame.K_RIGHT] or keys[pygame.K_d] else 0)
+            | (ACTION_JUMP if keys[pygame.K_SPACE] or keys[pygame.K_w] else 0)
+            | (ACTION_SHOOT if keys[pygame.K_z] or keys[pygame.K_x] else 0))
+
+
+class RollbackSession:
+    """One side of a two-player versus race with rollback netcode.
+    
+    Both peers simulate the same two games, one per player, and exchange
+    only their inputs over UDP.  Every packet repeats the inputs the peer
+    has not acknowledged yet, so lost packets are covered by the next one.
+    Local inputs are applied input_delay frames late.  Missing remote inputs
+    are predicted by repeating the last one received.  When a real input
+    differs from its prediction, the remote game is restored to that frame
+    and resimulated.
+    
+    The local game only ever sees real inputs, so only the remote game is
+    saved and rolled back.  Each game keeps its own copy of the random
+    module's state so resimulating one never shifts the other.  delay_ms
+    and loss delay or drop outgoing packets, for testing over loopback.
+    """
+    
+    MAGIC = b"MAYR"
+    
+    def __init__(self, player, peer="127.0.0.1", seed=0, input_delay=ROLLBACK_INPUT_DELAY,
+                 delay_ms=0, loss=0.0, port=VERSUS_PORT):
+        self.local = player - 1
+        self.remote = 1 - self.local
+        self.input_delay = input_delay
+        self.delay = delay_ms / 1000
+        self.loss = loss
+        self.net_rng = random.Random()
+        
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("", port + self.local))
+        self.sock.setblocking(False)
+        self.peer = (peer, port + self.remote)
+        self.outbox = deque()
+        
+        saved_rng = random.getstate()
+        random.seed(seed)
+        levels = {n: generate_level(n, level_width_for(n), n % 3 == 0) for n in range(1, 11)}
+        self.games = []
+        self.rng_states = []
+        for index in range(2):
+            random.seed(f"{seed}:{index}")
+            self.games.append(Game(headless=True, levels=levels))
+            self.rng_states.append(random.getstate())
+        random.setstate(saved_rng)
+        
+        self.frame = 0
+        self.local_inputs = bytearray(input_delay)
+        self.remote_inputs = bytearray()
+        self.remote_ack = 0
+        self.predicted = {}
+        self.saved = {}
+        self.stats = {"rollbacks": 0, "resimulated": 0, "max_rollback": 0, "rollback_ms": 0.0,
+                      "max_rollback_ms": 0.0, "stalls": 0}
+    
+    def close(self):
+        self.sock.close()
+    
+    def tick(self, action):
+        """Exchange inputs and, unless too far ahead of the peer, advance one frame.
+        
+        Returns False when the frame was stalled waiting for remote inputs.
+        """
+        self.receive()
+        advance = self.frame - len(self.remote_inputs) < ROLLBACK_MAX_FRAMES
+        if advance:
+            self.local_inputs.append(action)
+        self.send()
+        if not advance:
+            self.stats["stalls"] += 1
+            return False
+        self.simulate(self.local, self.local_inputs[self.frame])
+        self.simulate_remote(self.frame)
+        self.frame += 1
+        return True
+    
+    def simulate(self, index, action):
+        """Run one update of a game on its own random stream."""
+        game = self.games[index]
+        random.setstate(self.rng_states[index])
+        game.input_keys = ACTION_KEYS[action]
+        game.update()
+        self.rng_states[index] = random.getstate()
+    
+    def simulate_remote(self, frame):
+        """Update the remote game for frame, saving it first if its input is only predicted."""
+        if frame < len(self.remote_inputs):
+            self.simulate(self.remote, self.remote_inputs[frame])
+            return
+        action = self.remote_inputs[-1] if self.remote_inputs else 0
+        random.setstate(self.rng_states[self.remote])
+        self.saved[frame] = self.games[self.remote].state_parts()
+        self.predicted[frame] = action
+        self.simulate(self.remote, action)
+    
+    def send(self):
+        start = max(self.remote_ack, len(self.local_inputs) - ROLLBACK_PACKET_INPUTS)
+        inputs = bytes(self.local_inputs[start:])
+        packet = ROLLBACK_HEADER.pack(self.MAGIC, start, len(self.remote_inputs), len(inputs)) + inputs
+        if self.net_rng.random() >= self.loss:
+            self.outbox.append((time.perf_counter() + self.delay, packet))
+        now = time.perf_counter()
+        while self.outbox and self.outbox[0][0] <= now:
+            try:
+                self.sock.sendto(self.outbox.popleft()[1], self.peer)
+            except OSError:
+                pass
+    
+    def receive(self):
+        confirmed = len(self.remote_inputs)
+        while True:
+            try:
+                packet = self.sock.recv(ROLLBACK_HEADER.size + 255)
+            except OSError:
+                break
+            if len(packet) < ROLLBACK_HEADER.size:
+                continue
+            magic, start, ack, count = ROLLBACK_HEADER.unpack_from(packet)
+            if magic != self.MAGIC:
+                continue
+            self.remote_ack = max(self.remote_ack, ack)
+            inputs = packet[ROLLBACK_HEADER.size:ROLLBACK_HEADER.size + count]
+            have = len(self.remote_inputs)
+            if start <= have < start + len(inputs):
+                self.remote_inputs.extend(inputs[have - start:])
+        
+        mismatch = None
+        for frame in range(confirmed, len(self.remote_inputs)):
+            predicted = self.predicted.pop(frame, None)
+            if predicted is not None and predicted != self.remote_inputs[frame] and mismatch is None:
+                mismatch = frame
+        if mismatch is not None:
+            self.rollback(mismatch)
+        for frame in [f for f in self.saved if f < len(self.remote_inputs)]:
+            del self.saved[frame]
+    
+    def rollback(self, frame):
+        """Restore the remote game to frame and resimulate it up to the present."""
+        started = time.perf_counter()
+        current = self.frame
+        self.games[self.remote].restore_parts(self.saved[frame])
+        self.rng_states[self.remote] = random.getstate()
+        self.predicted.clear()
+        for resim in range(frame, current):
+            self.simulate_remote(resim)
+        stats = self.stats
+        stats["rollbacks"] += 1
+        stats["resimulated"] += current - frame
+        stats["max_rollback"] = max(stats["max_rollback"], current - frame)
+        elapsed = (time.perf_counter() - started) * 1000
+        stats["rollback_ms"] += elapsed
+        stats["max_rollback_ms"] = max(stats["max_rollback_ms"], elapsed)
+    
+    def checksum(self, index):
+        random.setstate(self.rng_states[index])
+        return zlib.crc32(b"".join(self.games[index].state_parts()))
+
+
+def run_versus(player, peer="127.0.0.1", seed=0, delay_ms=0, loss=0.0):
+    """Play one side of a versus race; start the other side with the other player number."""
+    pygame.init()
+    pygame.display.set_caption(f"SUPAR MAYRO - Versus, player {player}")
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    clock = pygame.time.Clock()
+    session = RollbackSession(player, peer, seed, delay_ms=delay_ms, loss=loss)
+    local = session.games[session.local]
+    remote = session.games[session.remote]
+    local.attach_screen(screen)
+    local.music = MusicPlayer()
+    remote.attach_screen(pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT)))
+    inset = pygame.Rect(SCREEN_WIDTH - SCREEN_WIDTH // 4 - 10, 80, SCREEN_WIDTH // 4, SCREEN_HEIGHT // 4)
+    label = local.small_font.render(f"Player {session.remote + 1}", True, WHITE)
+    
+    running = True
+    while running:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                running = False
+        session.tick(keys_to_action(pygame.key.get_pressed()))
+        local.music.flush(local.music_track())
+        remote.draw()
+        local.draw()
+        screen.blit(pygame.transform.smoothscale(remote.screen, inset.size), inset)
+        pygame.draw.rect(screen, WHITE, inset, 2)
+        screen.blit(label, (inset.x + 6, inset.bottom + 4))
+        pygame.display.flip()
+        clock.tick(FPS)
+    
+    session.close()
+    pygame.quit()
+    sys.exit()
+
+
+def versus_selftest(frames=600, delay_ms=75, loss=0.1, seed=0):
+    """Run both versus peers in this process over loopback and check they agree.
+    
+    Each side is driven by a RunnerBot on its own game.  After the last
+    frame the peers keep exchanging inputs until every prediction is
+    resolved, then the checksums of both games must match on both sides.
+    """
+    sessions = [RollbackSession(player, seed=seed, delay_ms=delay_ms, loss=loss) for player in (1, 2)]
+    bots = [RunnerBot(), RunnerBot()]
+    next_tick = time.perf_counter()
+    while any(session.frame < frames or len(session.remote_inputs) < frames for session in sessions):
+        for session, bot in zip(sessions, bots):
+            if session.frame < frames:
+                session.tick(keys_to_action(bot(session.games[session.local])))
+            else:
+                session.receive()
+                session.send()
+        next_tick += 1 / FPS
+        time.sleep(max(0, next_tick - time.perf_counter()))
+    
+    checksums = [[session.checksum(index) for index in range(2)] for session in sessions]
+    for session in sessions:
+        session.close()
+    return {
+        "frames": frames,
+        "round_trip_ms": 2 * delay_ms,
+        "loss": loss,
+        "in_sync": checksums[0] == checksums[1],
+        "players": [dict(session.stats, player=session.local + 1) for session in sessions],
+    }
+
+
+def run_playthrough(seed, bot="runner", max_ticks=36000, level_width=None, fixed_point=False):
+    """Play one headless game with freshly generated levels and return its outcome stats."""
+    set_fixed_point(fixed_point)
+    random.seed(seed)
+    LEVELS.clear()
+    game = Game(level_width=level_width, headless=True)
+    controller = BOTS[bot]()
+    while game.ticks < max_ticks and game.state in (STATE_PLAYING, STATE_BOSS):
+        game.input_keys = controller(game)
+        game.update()
+    
+    if game.state == STATE_WIN:
+        outcome = "win"
+    elif game.state == STATE_GAME_OVER:
+        outcome = "game_over"
+    else:
+        outcome = "timeout"
+    return {
+        "seed": seed,
+        "bot": bot,
+        "outcome": outcome,
+        "level_reached": game.current_level,
+        "score": game.player.score,
+        "ticks": game.ticks,
+        "deaths": dict(game.deaths_by_cause),
+    }
+
+
+def _run_playthrough_job(job):
+    return run_playthrough(*job)
+
+
+def aggregate_results(results):
+    """Combine per-run stats from run_playthrough into batch totals."""
+    summary = {
+        "runs": len(results),
+        "outcomes": {},
+        "levels_reached": {},
+        "deaths": {},
+        "mean_score": 0.0,
+        "mean_ticks": 0.0,
+        "unfinished_seeds": [],
+    }
+    for result in results:
+        summary["outcomes"][result["outcome"]] = summary["outcomes"].get(result["outcome"], 0) + 1
+        level = result["level_reached"]
+        summary["levels_reached"][level] = summary["levels_reached"].get(level, 0) + 1
+        for cause, count in result["deaths"].items():
+            summary["deaths"][cause] = summary["deaths"].get(cause, 0) + count
+        summary["mean_score"] += result["score"]
+        summary["mean_ticks"] += result["ticks"]
+        if result["outcome"] == "timeout":
+            summary["unfinished_seeds"].append(result["seed"])
+    if results:
+        summary["mean_score"] /= len(results)
+        summary["mean_ticks"] /= len(results)
+    summary["unfinished_seeds"].sort()
+    return summary
+
+
+def batch_run(seeds, bot="runner", processes=None, max_ticks=36000, level_width=None, fixed_point=False):
+    """Run one headless playthrough per seed across a process pool.
+    
+    Returns (results, summary).  Each worker regenerates its own LEVELS, so
+    runs are independent and reproducible from their seed alone.
+    """
+    jobs = [(seed, bot, max_ticks, level_width, fixed_point) for seed in seeds]
+    with multiprocessing.Pool(processes) as pool:
+        results = list(pool.imap_unordered(_run_playthrough_job, jobs, chunksize=max(1, len(jobs) // 64)))
+    results.sort(key=lambda result: result["seed"])
+    return results, aggregate_results(results)
+
+
+def bench_scaling(widths=(100, 500, 2000, 4000), ticks=300):
+    """Print per-tick update and draw cost for levels of increasing width."""
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    game = Game()
+    game.music.available = False
+    print(f"{'width':>8} {'tiles':>8} {'entities':>9} {'update us':>10} {'draw us':>9}")
+    for width in widths:
+        random.seed(width)
+        game.level_width = width
+        game.reset_game()
+        game.invincible_timer = ticks + 1
+        update_time = 0.0
+        draw_time = 0.0
+        for _ in range(ticks):
+            start = time.perf_counter()
+            game.update()
+            update_time += time.perf_counter() - start
+            start = time.perf_counter()
+            game.level.draw(game.screen, game.camera_x)
+            draw_time += time.perf_counter() - start
+        print(f"{width:>8} {len(game.level.tiles):>8} {len(game.level.entity_index):>9} "
+              f"{update_time / ticks * 1e6:>10.1f} {draw_time / ticks * 1e6:>9.1f}")
+    pygame.quit()
+
+
+def startup_probe(imported_at):
+    """Start a game up to its first frame and print wall-clock marks as JSON; used by bench_startup."""
     game = Game()
-    game.run()
+    window = time.time()
+    game.draw()
+    pygame.display.flip()
+    first_frame = time.time()
+    game.start_deferred().join()
+    print(json.dumps({"imported": imported_at, "window": window, "first_frame": first_frame, "deferred_done": time.time()}))
+    pygame.quit()
+
+
+def bench_startup(runs=5):
+    """Print time from launching a fresh interpreter to each startup mark of startup_probe."""
+    marks = ("imported", "window", "first_frame", "deferred_done")
+    print(f"{'run':>4} " + " ".join(f"{mark + ' ms':>16}" for mark in marks))
+    rows = []
+    for run in range(runs):
+        launched = time.time()
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), "--startup-probe"],
+                                capture_output=True, text=True, check=True).stdout
+        times = json.loads(output.strip().splitlines()[-1])
+        rows.append([(times[mark] - launched) * 1000 for mark in marks])
+        print(f"{run + 1:>4} " + " ".join(f"{ms:>16.1f}" for ms in rows[-1]))
+    medians = [sorted(column)[len(column) // 2] for column in zip(*rows)]
+    print(f"{'med':>4} " + " ".join(f"{ms:>16.1f}" for ms in medians))
+
+
+def bench_levelgen(widths=(100, 2000, 20000, 100000), count=5):
+    """Print average generate_level and generate_level_np time per level width."""
+    print(f"{'width':>8} {'python ms':>10} {'numpy ms':>9}")
+    for width in widths:
+        row = [f"{width:>8}"]
+        for generate, column in ((generate_level, 10), (generate_level_np, 9)):
+            rng = random.Random(width)
+            start = time.perf_counter()
+            for _ in range(count):
+                generate(5, width, False, rng)
+            row.append(f"{(time.perf_counter() - start) / count * 1e3:>{column}.1f}")
+        print(" ".join(row))
+
+
+if __name__ == "__main__":
+    imported_at = time.time()
+    parser = argparse.ArgumentParser(description="SUPAR MAYRO - Ultimate Platformer")
+    parser.add_argument("--endless", type=int, metavar="SEED", help="play the endless runner mode generated from SEED")
+    parser.add_argument("--level-width", type=int, metavar="TILES", help="generate every level TILES columns wide")
+    parser.add_argument("--bench-scaling", action="store_true", help="report per-tick cost for increasing level widths and exit")
+    parser.add_argument("--bench-levelgen", action="store_true", help="compare list and numpy level generation times and exit")
+    parser.add_argument("--bench-startup", action="store_true", help="report time from launch to the first frame over a few fresh runs and exit")
+    parser.add_argument("--startup-probe", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--pipelined", action="store_true", help="simulate the next tick on a worker thread during flip and the frame limiter sleep (can be slower than the default loop)")
+    parser.add_argument("--ai-budget", type=float, metavar="MS", help="also stop AI decisions for a tick once MS milliseconds are spent")
+    parser.add_argument("--quality", type=int, choices=range(len(QUALITY_TIERS)), metavar="TIER", help="pin cosmetic quality to TIER (0 best) instead of adapting it to frame time")
+    parser.add_argument("--profile-frames", type=int, metavar="N", help="profile the first N frames with cProfile (F12 profiles the next N in game)")
+    parser.add_argument("--trace", action="store_true", help="record timed spans of recent frames; F11 and quitting save them as Chrome trace JSON")
+    parser.add_argument("--memory-report", action="store_true", help="write tracemalloc checkpoints at level loads, level ends and every 30 s to memory-<time>.txt")
+    parser.add_argument("--fixed-point", action="store_true", help="use deterministic fixed-point physics for moving entities")
+    parser.add_argument("--batch", type=int, metavar="RUNS", help="run RUNS headless playthroughs across a process pool and exit")
+    parser.add_argument("--batch-seed", type=int, default=0, metavar="SEED", help="first seed used by --batch")
+    parser.add_argument("--bot", choices=sorted(BOTS), default="runner", help="input controller used by --batch")
+    parser.add_argument("--processes", type=int, metavar="N", help="worker processes for --batch (default: all cores)")
+    parser.add_argument("--max-ticks", type=int, default=36000, help="tick limit per --batch run")
+    parser.add_argument("--batch-out", metavar="FILE", help="write per-run --batch results to FILE as JSON")
+    parser.add_argument("--versus", type=int, choices=(1, 2), metavar="PLAYER", help="play a two-player versus race as player 1 or 2")
+    parser.add_argument("--peer", default="127.0.0.1", metavar="HOST", help="address of the other --versus player")
+    parser.add_argument("--versus-seed", type=int, default=0, metavar="SEED", help="level seed shared by both --versus players")
+    parser.add_argument("--net-delay", type=int, default=0, metavar="MS", help="delay every outgoing versus packet by MS milliseconds")
+    parser.add_argument("--net-loss", type=float, default=0.0, metavar="FRACTION", help="drop this fraction of outgoing versus packets")
+    parser.add_argument("--versus-test", type=int, metavar="FRAMES", help="run both versus players over loopback for FRAMES frames, check they agree and exit")
+    args = parser.parse_args()
+    set_fixed_point(args.fixed_point)
+    AI_BUDGET_MS = args.ai_budget
+    if args.trace:
+        TRACER = Tracer()
+    if args.memory_report:
+        MEMORY = MemoryReport()
+    
+    if args.bench_scaling:
+        bench_scaling()
+        sys.exit()
+    
+    if args.bench_levelgen:
+        bench_levelgen()
+        sys.exit()
+    
+    if args.bench_startup:
+        bench_startup()
+        sys.exit()
+    
+    if args.startup_probe:
+        startup_probe(imported_at)
+        sys.exit()
+    
+    if args.versus_test:
+        print(json.dumps(versus_selftest(args.versus_test, args.net_delay, args.net_loss, args.versus_seed), indent=2))
+        sys.exit()
+    
+    if args.versus:
+        run_versus(args.versus, args.peer, args.versus_seed, args.net_delay, args.net_loss)
+    
+    if args.batch:
+        seeds = range(args.batch_seed, args.batch_seed + args.batch)
+        results, summary = batch_run(seeds, args.bot, args.processes, args.max_ticks, args.level_width, args.fixed_point)
+        if args.batch_out:
+            with open(args.batch_out, "w") as f:
+                json.dump({"summary": summary, "runs": results}, f, indent=2)
+        print(json.dumps(summary, indent=2))
+        sys.exit()
+    
+    game = Game(endless_seed=args.endless, level_width=args.level_width)
+    game.run(pipelined=args.pipelined, quality=args.quality, profile_frames=args.profile_frames)
@@ -0,0 +1,47 @@
+import os
+import struct
+import sys
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pygame
+import pytest
+
+import mario_platformer as game
+
+
+@pytest.fixture
+def mixer():
+    pygame.mixer.init(frequency=44100, size=-16, channels=2, buffer=512)
+    yield pygame.mixer.get_init()
+    pygame.mixer.quit()
+
+
+@pytest.mark.parametrize("contents", [
+    b"SMSB\x00\x00",
+    b"SMSB" + struct.pack("!I", 5) + b"{bad}",
+    b"SMSB" + struct.pack("!I", 2) + b"17",
+    b"SMSB" + struct.pack("!I", 9) + b"[1, 2, 3]",
+    b"SMSB" + struct.pack("!I", 100) + b"[",
+])
+def test_corrupt_cache_is_rebuilt(tmp_path, mixer, contents):
+    bank = game.SoundBank(str(tmp_path))
+    path = bank.cache_path(mixer)
+    with open(path, "wb") as f:
+        f.write(contents)
+    assert bank.read(path) is None
+
+    bank.warm()
+    assert sorted(bank.sounds) == sorted(game.SOUND_EFFECTS)
+    assert bank.read(path) is not None
+
+
+def test_music_player_starts_with_corrupt_cache(tmp_path, mixer):
+    player = game.MusicPlayer(deferred=True)
+    player.bank = game.SoundBank(str(tmp_path))
+    with open(player.bank.cache_path(mixer), "wb") as f:
+        f.write(b"SMSB\x00\x00")
+    player.start()
+    assert player.available